@@ -1,50 +1,65 @@
 import json
-import os
 import base64
 import logging
 from typing import List, Dict, Any
-from openai import OpenAI
 from vector_store import vector_store
+import hybrid_search
+import answer_cache
+import context_packer
+from image_pipeline import prepare_image
+from openai_client import client_manager, CircuitOpenError
+from ai_assistant_simple import generate_fallback_answer
 
 logger = logging.getLogger(__name__)
 
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
+if not client_manager.configured:
     logger.warning("OPENAI_API_KEY not found in environment variables")
 
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+# Match cached answers with the same sentence embeddings used for retrieval
+answer_cache.set_embedder(lambda question: vector_store.encode_query(question)[0])
 
 
 def answer_question(question: str, image_base64: str = None) -> Dict[str, Any]:
     """
     Answer a student question using the vector store and OpenAI.
     """
-    if not openai_client:
+    if not client_manager.configured:
         return {
             "answer": "OpenAI API key not configured. Please set OPENAI_API_KEY environment variable.",
             "links": []
         }
     
     try:
-        # Search for relevant content
-        search_results = vector_store.search(question, top_k=5)
+        # Questions with images depend on the image, so only text questions are cached
+        if not image_base64:
+            cached = answer_cache.lookup(question)
+            if cached:
+                return cached
         
-        # Prepare context from search results
-        context_parts = []
-        relevant_links = []
+        # Search for relevant content: keyword and vector results fused
+        search_results, timings = hybrid_search.search(question)
+        logger.info("Retrieval timings: " + ", ".join(
+            f"{stage} {ms:.1f}ms" for stage, ms in timings.items() if ms is not None))
+        
+        # Pack the best distinct passages into the context token budget
+        packed = context_packer.pack(
+            search_results,
+            lambda doc: f"Title: {doc['title']}\nURL: {doc['url']}\nContent: {doc['content']}",
+            separator="\n\n---\n\n"
+        )
+        context = packed['context']
         
-        for doc, score in search_results:
-            if score > 0.3:  # Threshold for relevance
-                context_parts.append(f"Title: {doc['title']}\nURL: {doc['url']}\nContent: {doc['content'][:500]}...")
+        relevant_links = []
+        for doc in packed['passages']:
+            # Several passages can come from the same document
+            if all(link['url'] != doc['url'] for link in relevant_links):
                 relevant_links.append({
                     "url": doc['url'],
                     "text": doc['title']
                 })
         
-        context = "\n\n---\n\n".join(context_parts)
-        
         # Prepare messages for OpenAI
         messages = [
             {
@@ -79,12 +94,8 @@ Please provide a helpful answer to the student's question based on the above con
         
         # Add image if provided
         if image_base64:
-            user_content.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/jpeg;base64,{image_base64}"
-                }
-            })
+            # Base64 or an already prepared image; sent in its real format
+            user_content.append(prepare_image(image_base64).content_part())
             user_content[0]["text"] += "\n\nNote: The student has also provided an image/screenshot. Please analyze it in context of their question."
         
         messages.append({
@@ -93,7 +104,7 @@ Please provide a helpful answer to the student's question based on the above con
         })
         
         # Get response from OpenAI
-        response = openai_client.chat.completions.create(
+        response = client_manager.chat_completion(
             model="gpt-4o",  # the newest OpenAI model is "gpt-4o"
             messages=messages,
             max_tokens=1000,
@@ -105,11 +116,17 @@ Please provide a helpful answer to the student's question based on the above con
         # Filter and rank links based on relevance
         final_links = rank_and_filter_links(relevant_links, question, answer)
         
-        return {
+        result = {
             "answer": answer,
             "links": final_links[:3]  # Return top 3 most relevant links
         }
+        if not image_base64:
+            answer_cache.store(question, result)
+        return result
         
+    except CircuitOpenError:
+        # Upstream is failing; answer from search results without waiting on it
+        return generate_fallback_answer(question, image_base64)
     except Exception as e:
         logger.error(f"Error answering question: {e}")
         return {
@@ -156,7 +173,7 @@ def initialize_vector_store():
     Initialize the vector store with scraped content.
     """
     try:
-        vector_store.load_or_create_index()
+        vector_store.ensure_loaded()
         logger.info("Vector store initialized successfully")
     except Exception as e:
         logger.error(f"Error initializing vector store: {e}")
@@ -1,59 +1,105 @@
 """
 Simplified AI assistant without heavy ML dependencies for Replit compatibility.
 """
+import asyncio
+import inspect
 import logging
 import os
-from typing import Dict, Any, List
-from models import ScrapedContent
-from app import db
+from typing import Dict, Any, Iterator, List, Tuple
+from models import ScrapedContent, ContentPassage
+from app import app, db
+import inverted_index
+import fts_search
+import answer_cache
+import context_packer
+from image_pipeline import prepare_image, ImageError
+from openai_client import client_manager
 
 logger = logging.getLogger(__name__)
 
+# Lexical search backend: 'fts' (SQLite FTS5), 'bm25' (inverted index) or 'auto'
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto').lower()
+
+
+# Candidate passages fetched per requested result, so that several hits from
+# the same document still leave enough distinct documents after grouping
+PASSAGE_OVERFETCH = 3
+
+OPENAI_MODEL = "gpt-4o-mini"
+
+
+def _inverted_index_search(question: str, top_k: int) -> List[Dict]:
+    """
+    Score passages with the BM25 inverted index and load only the top-k rows.
+    """
+    ranked = inverted_index.search(question, top_k)
+    if not ranked:
+        return []
+
+    ids = [passage_id for passage_id, _ in ranked]
+    rows = db.session.execute(
+        db.select(ContentPassage, ScrapedContent.url)
+        .join(ScrapedContent, ScrapedContent.id == ContentPassage.content_id)
+        .where(ContentPassage.id.in_(ids))
+    ).all()
+    passages = {passage.id: (passage, url) for passage, url in rows}
+
+    results = []
+    for passage_id, score in ranked:
+        if passage_id not in passages:
+            continue
+        passage, url = passages[passage_id]
+        results.append({
+            'id': passage.content_id,
+            'passage_id': passage.id,
+            'content': passage.text,
+            'title': passage.title,
+            'url': url,
+            'score': score
+        })
+    return results
+
+
+def lexical_search(question: str, limit: int) -> List[Dict]:
+    """
+    The top passages by keyword relevance, best first.
+    Uses SQLite FTS5 when available, otherwise the BM25 inverted index.
+    """
+    if SEARCH_BACKEND != 'bm25' and fts_search.fts_available():
+        return fts_search.search(question, limit)
+    return _inverted_index_search(question, limit)
+
+
 def simple_search(question: str, top_k: int = 5) -> List[Dict]:
     """
-    Simple text-based search through scraped content using basic keyword matching.
+    Keyword search over content passages.
+    Returns the best-matching passage of each of the top-k documents.
     """
     try:
-        # Split question into keywords
-        keywords = question.lower().split()
-        
-        # Query database for content containing keywords
-        content_items = ScrapedContent.query.all()
-        
+        passages = lexical_search(question, top_k * PASSAGE_OVERFETCH)
+
+        # Keep the best passage per document; results are already sorted
         results = []
-        for item in content_items:
-            content_lower = item.content.lower()
-            title_lower = (item.title or "").lower()
-            
-            # Count keyword matches
-            score = 0
-            for keyword in keywords:
-                if keyword in content_lower:
-                    score += content_lower.count(keyword)
-                if keyword in title_lower:
-                    score += title_lower.count(keyword) * 2  # Title matches weighted higher
-            
-            if score > 0:
-                results.append({
-                    'content': item.content[:500] + "..." if len(item.content) > 500 else item.content,
-                    'title': item.title,
-                    'url': item.url,
-                    'score': score
-                })
-        
-        # Sort by score and return top results
-        results.sort(key=lambda x: x['score'], reverse=True)
+        seen = set()
+        for passage in passages:
+            if passage['id'] in seen:
+                continue
+            seen.add(passage['id'])
+            results.append(passage)
+
         return results[:top_k]
-        
+
     except Exception as e:
         logger.error(f"Error in simple search: {e}")
         return []
 
-def generate_fallback_answer(question: str, image_base64: str = None) -> Dict[str, Any]:
+def generate_fallback_answer(question: str, image_base64: str = None,
+                             search_results: List[Dict] = None) -> Dict[str, Any]:
     """
     Generate a fallback answer using only search results when AI is unavailable.
     """
-    search_results = simple_search(question)
+    if search_results is None:
+        search_results = simple_search(question)
     
     if search_results:
         # Create answer from top search results
@@ -82,29 +128,17 @@ def generate_fallback_answer(question: str, image_base64: str = None) -> Dict[st
             'source': 'no_results'
         }
 
-def answer_question(question: str, image_base64: str = None) -> Dict[str, Any]:
+def build_messages(question: str, search_results: List[Dict], image_base64: str = None) -> List[Dict]:
     """
-    Answer a student question using simple search and OpenAI.
+    Build the chat messages for a question and its search results.
     """
-    try:
-        # Check if OpenAI API key is available
-        openai_key = os.environ.get('OPENAI_API_KEY')
-        
-        if openai_key:
-            # Try using OpenAI with search context
-            search_results = simple_search(question)
-            
-            try:
-                import openai
-                client = openai.OpenAI(api_key=openai_key)
-                
-                # Prepare context from search results
-                context = ""
-                if search_results:
-                    context = "\n\n".join([f"- {result['content'][:300]}" for result in search_results[:3]])
-                
-                # Create prompt
-                prompt = f"""You are a helpful teaching assistant for a data science course. Answer the student's question based on the provided course materials.
+    # Pack the best distinct results into the context token budget
+    context = ""
+    if search_results:
+        context = context_packer.pack(search_results, lambda result: f"- {result['content']}")['context']
+    
+    # Create prompt
+    prompt = f"""You are a helpful teaching assistant for a data science course. Answer the student's question based on the provided course materials.
 
 Course Materials Context:
 {context}
@@ -113,60 +147,210 @@ Student Question: {question}
 
 Please provide a clear, helpful answer. If the context doesn't contain enough information, acknowledge this and provide general guidance."""
 
-                # Handle image if provided
-                messages = [{"role": "user", "content": prompt}]
-                
-                if image_base64:
-                    messages = [{
-                        "role": "user", 
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                            }
-                        ]
-                    }]
-                
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=messages,
+    # Handle image if provided (base64 or an already prepared image)
+    if image_base64:
+        return [{
+            "role": "user", 
+            "content": [
+                {"type": "text", "text": prompt},
+                prepare_image(image_base64).content_part()
+            ]
+        }]
+    
+    return [{"role": "user", "content": prompt}]
+
+def build_links(search_results: List[Dict]) -> List[Dict]:
+    """
+    Prepare response links from search results.
+    """
+    links = []
+    for result in search_results[:5]:
+        links.append({
+            'title': result['title'] or 'Course Material',
+            'url': result['url'],
+            'relevance': min(result['score'] / 10, 1.0)
+        })
+    return links
+
+def error_answer() -> Dict[str, Any]:
+    return {
+        'answer': "I'm sorry, but I'm experiencing technical difficulties. Please try again later or contact your instructor for assistance.",
+        'links': [],
+        'source': 'error'
+    }
+
+def answer_question(question: str, image_base64: str = None) -> Dict[str, Any]:
+    """
+    Answer a student question using simple search and OpenAI.
+    """
+    try:
+        # Questions with images depend on the image, so only text questions are cached
+        if not image_base64:
+            cached = answer_cache.lookup(question)
+            if cached:
+                return cached
+        
+        # Check if OpenAI API key is available
+        if client_manager.configured:
+            # Try using OpenAI with search context
+            search_results = simple_search(question)
+            
+            try:
+                response = client_manager.chat_completion(
+                    model=OPENAI_MODEL,
+                    messages=build_messages(question, search_results, image_base64),
                     max_tokens=1000,
                     temperature=0.7
                 )
                 
-                answer = response.choices[0].message.content
-                
-                # Prepare links from search results
-                links = []
-                for result in search_results[:5]:
-                    links.append({
-                        'title': result['title'] or 'Course Material',
-                        'url': result['url'],
-                        'relevance': min(result['score'] / 10, 1.0)
-                    })
-                
-                return {
-                    'answer': answer,
-                    'links': links,
+                result = {
+                    'answer': response.choices[0].message.content,
+                    'links': build_links(search_results),
                     'source': 'openai_with_search'
                 }
+                if not image_base64:
+                    answer_cache.store(question, result)
+                return result
                 
             except Exception as e:
                 logger.error(f"OpenAI API error: {e}")
                 # Fall back to search-only answer
-                return generate_fallback_answer(question, image_base64)
+                return generate_fallback_answer(question, image_base64, search_results)
         else:
             # No OpenAI key available, use search-only
             return generate_fallback_answer(question, image_base64)
             
     except Exception as e:
         logger.error(f"Error in answer_question: {e}")
-        return {
-            'answer': "I'm sorry, but I'm experiencing technical difficulties. Please try again later or contact your instructor for assistance.",
-            'links': [],
-            'source': 'error'
+        return error_answer()
+
+def _with_app_context(fn, *args):
+    # Worker threads need their own app context so each gets its own DB session
+    with app.app_context():
+        return fn(*args)
+
+async def answer_question_async(question: str, image_base64: str = None) -> Dict[str, Any]:
+    """
+    Async variant of answer_question for the ASGI entry point.
+    The cache lookup and search run concurrently in worker threads and the
+    completion is awaited on the async OpenAI client, so the event loop can
+    keep many questions in flight.
+    
+    `image_base64` may also be an awaitable of the prepared image (a task
+    already decoding it), awaited only once the search is done. ImageError
+    from it is raised to the caller rather than answered.
+    """
+    try:
+        use_cache = not image_base64
+        
+        lookups = [asyncio.to_thread(_with_app_context, simple_search, question)]
+        if use_cache:
+            lookups.append(asyncio.to_thread(_with_app_context, answer_cache.lookup, question))
+        search_results, *cached = await asyncio.gather(*lookups)
+        if cached and cached[0]:
+            return cached[0]
+        if inspect.isawaitable(image_base64):
+            image_base64 = await image_base64
+        
+        if not client_manager.configured:
+            return await asyncio.to_thread(
+                _with_app_context, generate_fallback_answer, question, image_base64, search_results
+            )
+        
+        try:
+            response = await client_manager.chat_completion_async(
+                model=OPENAI_MODEL,
+                messages=build_messages(question, search_results, image_base64),
+                max_tokens=1000,
+                temperature=0.7
+            )
+        except Exception as e:
+            logger.error(f"OpenAI API error: {e}")
+            return await asyncio.to_thread(
+                _with_app_context, generate_fallback_answer, question, image_base64, search_results
+            )
+        
+        result = {
+            'answer': response.choices[0].message.content,
+            'links': build_links(search_results),
+            'source': 'openai_with_search'
         }
+        if use_cache:
+            await asyncio.to_thread(_with_app_context, answer_cache.store, question, result)
+        return result
+        
+    except ImageError:
+        raise
+    except Exception as e:
+        logger.error(f"Error in answer_question_async: {e}")
+        return error_answer()
+
+def stream_answer(question: str, image_base64: str = None) -> Iterator[Tuple[str, Any]]:
+    """
+    Answer a question incrementally for streaming responses.
+    Yields ('links', links) as soon as retrieval is done, then ('token', text)
+    pieces of the answer as they arrive, and finally ('done', result) with the
+    complete answer_question-style result. A later 'links' event replaces the
+    earlier one, and 'reset' discards the tokens received so far.
+    """
+    try:
+        if not image_base64:
+            cached = answer_cache.lookup(question)
+            if cached:
+                yield 'links', cached['links']
+                yield 'token', cached['answer']
+                yield 'done', cached
+                return
+        
+        search_results = simple_search(question)
+        links = build_links(search_results)
+        yield 'links', links
+        
+        parts = []
+        if client_manager.configured:
+            try:
+                stream = client_manager.stream_chat_completion(
+                    model=OPENAI_MODEL,
+                    messages=build_messages(question, search_results, image_base64),
+                    max_tokens=1000,
+                    temperature=0.7
+                )
+                
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    text = chunk.choices[0].delta.content
+                    if text:
+                        parts.append(text)
+                        yield 'token', text
+                
+                result = {
+                    'answer': ''.join(parts),
+                    'links': links,
+                    'source': 'openai_with_search'
+                }
+                if not image_base64:
+                    answer_cache.store(question, result)
+                yield 'done', result
+                return
+                
+            except Exception as e:
+                logger.error(f"OpenAI API error: {e}")
+                # A failure mid-stream leaves partial tokens for the client to discard
+                if parts:
+                    yield 'reset', None
+        
+        result = generate_fallback_answer(question, image_base64, search_results)
+        if result['links'] != links:
+            yield 'links', result['links']
+        yield 'token', result['answer']
+        yield 'done', result
+        
+    except Exception as e:
+        logger.error(f"Error in stream_answer: {e}")
+        result = error_answer()
+        yield 'token', result['answer']
+        yield 'done', result
 
 def rank_and_filter_links(links: List[Dict], question: str, answer: str) -> List[Dict]:
     """
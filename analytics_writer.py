@@ -0,0 +1,145 @@
+"""
+Background writer for QuestionAnswer analytics records.
+
+Request handlers hand records to a bounded in-memory queue and return
+immediately; a daemon thread inserts them with one executemany per batch,
+flushing when the batch is full or the flush interval has passed. When the
+queue is full new records are dropped (and counted) rather than slowing
+requests down. Pending records are flushed at interpreter shutdown.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+from sqlalchemy import insert
+from app import app, db
+from models import QuestionAnswer
+import stats_rollup
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = int(os.environ.get('ANALYTICS_QUEUE_SIZE', 10000))
+BATCH_SIZE = int(os.environ.get('ANALYTICS_BATCH_SIZE', 200))
+FLUSH_INTERVAL = float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 1.0))
+DROP_LOG_EVERY = 100  # Log a warning every N dropped records
+
+
+class AnalyticsWriter:
+    def __init__(self, queue_size: int = QUEUE_SIZE, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so each (gunicorn) worker starts its own
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._stop = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='analytics-writer', daemon=True)
+            self._thread.start()
+
+    def record(self, question: str, answer: str, links: List[Dict], has_image: bool,
+               response_time: float) -> bool:
+        """
+        Queue a QuestionAnswer record. Returns False if it had to be dropped.
+        """
+        self._ensure_started()
+        row = {
+            'question': question,
+            'answer': answer,
+            'links': json.dumps(links),
+            'has_image': has_image,
+            'response_time': response_time,
+            'created_at': datetime.utcnow()
+        }
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped % DROP_LOG_EVERY == 1:
+                logger.warning(f"Analytics queue full, {dropped} records dropped so far")
+            return False
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                if self._stop.is_set():
+                    break
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+                deadline = None
+
+        if batch:
+            self._write(batch)
+
+    def _write(self, rows: List[Dict]):
+        with app.app_context():
+            try:
+                # A list of parameter sets runs as a single executemany
+                db.session.execute(insert(QuestionAnswer), rows)
+                # Keep the /api/stats rollups in the same transaction
+                stats_rollup.record_batch(db.session.connection(), rows)
+                db.session.commit()
+                self.written += len(rows)
+            except Exception as e:
+                db.session.rollback()
+                self.failed += len(rows)
+                logger.error(f"Error saving {len(rows)} analytics records: {e}")
+
+    def flush(self, timeout: float = 10.0):
+        """
+        Write everything queued so far and stop the writer thread.
+        The next record() starts a new one.
+        """
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(f"Analytics writer did not finish flushing, {self._queue.qsize()} records pending")
+        self._thread = None
+
+    def stats(self) -> Dict:
+        return {
+            'pending': self._queue.qsize() if self._queue is not None else 0,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+
+# Global analytics writer instance
+analytics_writer = AnalyticsWriter()
+atexit.register(analytics_writer.flush)
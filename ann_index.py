@@ -0,0 +1,230 @@
+"""
+Approximate nearest neighbour index types for the vector store.
+
+Supported types:
+    flat    exact inner-product scan (faiss.IndexFlatIP)
+    ivf     inverted file with exact vectors (IVF-Flat), tuned with nprobe
+    hnsw    hierarchical navigable small-world graph, tuned with efSearch
+    ivfpq   inverted file with product-quantized vectors, tuned with nprobe
+
+Run `python ann_index.py` to print a recall-vs-latency report for each type
+against the flat index on the passages currently in the database.
+"""
+import argparse
+import json
+import logging
+import math
+import time
+from typing import Dict, List, Optional
+import numpy as np
+import faiss
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ('flat', 'ivf', 'hnsw', 'ivfpq')
+
+HNSW_M = 32  # Graph neighbours per node
+HNSW_EF_CONSTRUCTION = 80
+PQ_M = 16  # Sub-quantizers; must divide the embedding dimension
+PQ_BITS = 8
+MIN_POINTS_PER_CENTROID = 39  # Below this FAISS k-means warns and clusters poorly
+
+
+def default_nlist(count: int) -> int:
+    """
+    Number of IVF lists for a corpus size (about 4 * sqrt(n)).
+    """
+    return max(1, min(int(4 * math.sqrt(count)), count // MIN_POINTS_PER_CENTROID))
+
+
+def build_index(index_type: str, dimension: int, training_vectors: np.ndarray,
+                nlist: Optional[int] = None) -> faiss.Index:
+    """
+    Create and train an empty index of the requested type.
+    Falls back to a flat index when there is too little data to train on.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    count = len(training_vectors)
+
+    if index_type == 'flat':
+        return faiss.IndexFlatIP(dimension)
+
+    if index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+
+    nlist = nlist or default_nlist(count)
+    min_training = nlist * MIN_POINTS_PER_CENTROID
+    if index_type == 'ivfpq':
+        min_training = max(min_training, MIN_POINTS_PER_CENTROID * 2 ** PQ_BITS)
+    if count < min_training or nlist < 2:
+        logger.warning(f"Only {count} training vectors for a {index_type} index, using flat index instead")
+        return faiss.IndexFlatIP(dimension)
+
+    quantizer = faiss.IndexFlatIP(dimension)
+    if index_type == 'ivf':
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, PQ_M, PQ_BITS, faiss.METRIC_INNER_PRODUCT)
+
+    start = time.time()
+    index.train(np.ascontiguousarray(training_vectors, dtype='float32'))
+    logger.info(f"Trained {index_type} index with {nlist} lists on {count} vectors in {time.time() - start:.2f}s")
+    return index
+
+
+def search_params(index: faiss.Index, nprobe: Optional[int] = None,
+                  ef_search: Optional[int] = None,
+                  exclude: Optional[np.ndarray] = None) -> Optional[faiss.SearchParameters]:
+    """
+    Per-query search parameters for the index, or None for exact indexes.
+    Passing parameters per call keeps concurrent searches from interfering.
+    `exclude` lists ids (e.g. deleted documents) that must not be returned.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        if ef_search:
+            params.efSearch = ef_search
+    elif isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        if nprobe:
+            params.nprobe = min(nprobe, index.nlist)
+    elif exclude is not None and len(exclude):
+        params = faiss.SearchParameters()
+    else:
+        return None
+
+    if exclude is not None and len(exclude):
+        excluded = faiss.IDSelectorBatch(np.asarray(exclude, dtype='int64'))
+        selector = faiss.IDSelectorNot(excluded)
+        params.sel = selector
+        # params does not own the selectors; keep them alive alongside it
+        params._selectors = (excluded, selector)
+    return params
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """
+    Name of the index type, as accepted by build_index.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'ivfpq'
+    if isinstance(index, faiss.IndexIVF):
+        return 'ivf'
+    return 'flat'
+
+
+def read_index(path: str, mmap: bool = False) -> faiss.Index:
+    """
+    Read an index file. With `mmap`, flat vector storage (flat and HNSW
+    indexes, IVF coarse quantizers) is mapped from the file instead of
+    copied, so every process serving the same file shares one copy in the
+    page cache. Mapped indexes are read-only; see owned_copy().
+    """
+    if mmap:
+        if hasattr(faiss, 'IO_FLAG_MMAP_IFC'):
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC)
+        logger.warning("This FAISS build cannot memory-map indexes, reading into memory instead")
+    return faiss.read_index(path)
+
+
+def owned_copy(index: faiss.Index) -> faiss.Index:
+    """
+    A private, writable in-memory copy of an index (e.g. a mapped one).
+    """
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def recall_report(embeddings: np.ndarray, queries: np.ndarray, top_k: int = 10,
+                  nprobes: List[int] = (1, 4, 8, 16, 32),
+                  ef_searches: List[int] = (16, 32, 64, 128)) -> List[Dict]:
+    """
+    Measure recall@k and per-query latency of each index type against the
+    exact flat index on the same (normalized) embeddings.
+    """
+    top_k = min(top_k, len(embeddings))
+    dimension = embeddings.shape[1]
+
+    def timed_search(index, params):
+        start = time.perf_counter()
+        _, found = index.search(queries, top_k, params=params)
+        return found, (time.perf_counter() - start) * 1000 / len(queries)
+
+    flat = faiss.IndexFlatIP(dimension)
+    flat.add(embeddings)
+    truth, flat_ms = timed_search(flat, None)
+    truth_sets = [set(row) for row in truth]
+
+    def recall(found):
+        hits = sum(len(truth_sets[i] & set(row)) for i, row in enumerate(found))
+        return hits / (len(queries) * top_k)
+
+    report = [{'index_type': 'flat', 'param': None, 'recall': 1.0, 'latency_ms': flat_ms, 'build_s': 0.0}]
+
+    for index_type in ('ivf', 'hnsw', 'ivfpq'):
+        start = time.time()
+        index = build_index(index_type, dimension, embeddings)
+        index.add(embeddings)
+        build_s = time.time() - start
+        if index_type_of(index) != index_type:
+            continue  # Not enough data to train this type
+
+        if index_type == 'hnsw':
+            settings = [('efSearch', ef, search_params(index, ef_search=ef)) for ef in ef_searches]
+        else:
+            settings = [('nprobe', n, search_params(index, nprobe=n)) for n in nprobes]
+
+        for name, value, params in settings:
+            found, latency_ms = timed_search(index, params)
+            report.append({
+                'index_type': index_type,
+                'param': f"{name}={value}",
+                'recall': recall(found),
+                'latency_ms': latency_ms,
+                'build_s': build_s
+            })
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency report for vector index types")
+    parser.add_argument('--queries', type=int, default=200, help="Number of passages sampled as queries")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help="Print machine-readable output")
+    args = parser.parse_args()
+
+    from app import app, initialize_database
+    from vector_store import vector_store
+
+    initialize_database()
+    with app.app_context():
+        texts = vector_store.passage_texts()
+    if not texts:
+        print("No passages in the database")
+        return
+
+    embeddings = vector_store.encode(texts)
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(texts), size=min(args.queries, len(texts)), replace=False)
+    queries = embeddings[sample]
+
+    report = recall_report(embeddings, queries, args.top_k)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{len(texts)} passages, {len(queries)} queries, recall@{args.top_k}")
+    print(f"{'type':<8}{'param':<14}{'recall':>8}{'ms/query':>10}{'build s':>9}")
+    for row in report:
+        print(f"{row['index_type']:<8}{row['param'] or '-':<14}{row['recall']:>8.3f}"
+              f"{row['latency_ms']:>10.3f}{row['build_s']:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
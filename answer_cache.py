@@ -0,0 +1,185 @@
+"""
+Semantic answer cache in front of answer_question.
+
+A new question is matched against previously answered ones, first exactly
+(on the normalized text) and then by embedding similarity above a threshold.
+Entries live in the database so every worker shares them, and are cleared by
+mapper events whenever ScrapedContent changes.
+
+The similarity tier needs a dense sentence embedder, registered with
+set_embedder() by the vector-store assistant; without one only exact matches
+are served. Bag-of-words similarity cannot tell "why does X fail" from "why
+doesn't X fail". Even with an embedder, a similar question is only served
+when it mentions the same numbers and identifiers ("GA4" is not "GA5").
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, FrozenSet, Optional, Tuple
+import numpy as np
+from sqlalchemy import delete, event, func, select
+from app import db
+from models import ScrapedContent, CachedAnswer
+from embedding_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+SIMILARITY_THRESHOLD = float(os.environ.get('ANSWER_CACHE_THRESHOLD', 0.92))
+MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 5000))
+
+# Words with a digit or inner punctuation, or capitalized past the first letter:
+# assignment and version numbers, dates, model names, file and function names
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+(?:[._\-/:][A-Za-z0-9]+)*")
+_IDENTIFIER_RE = re.compile(r"\d|[._\-/:]|.[A-Z]")
+
+_embedder: Optional[Callable[[str], np.ndarray]] = None
+_lock = threading.Lock()
+# In-process similarity index: entry id -> (question vector, identifiers)
+_vectors: Dict[int, Tuple[np.ndarray, FrozenSet[str]]] = {}
+_synced = (0, 0)  # (max id, row count) of the table when _vectors was last synced
+
+
+def question_hash(question: str) -> str:
+    return hashlib.sha256(normalize_query(question).encode('utf-8')).hexdigest()
+
+
+def set_embedder(embedder: Callable[[str], np.ndarray]):
+    """
+    Use a dense sentence embedder (returning normalized vectors) for similarity.
+    """
+    global _embedder, _synced
+    with _lock:
+        _embedder = embedder
+        _vectors.clear()
+        _synced = (0, 0)
+
+
+def identifiers(question: str) -> FrozenSet[str]:
+    """
+    The numbers and identifier-like names in a question, lowercased.
+    Questions differing in these ask about different things.
+    """
+    return frozenset(token.lower() for token in _TOKEN_RE.findall(question) if _IDENTIFIER_RE.search(token))
+
+
+def _vectorize(question: str) -> Tuple[np.ndarray, FrozenSet[str]]:
+    return np.asarray(_embedder(question), dtype='float32').reshape(-1), identifiers(question)
+
+
+def _sync_vectors():
+    """
+    Bring the in-process similarity index in line with the shared table.
+    Reconciled by id: vectors of rows that disappeared (invalidated or
+    trimmed, possibly by another worker) are dropped, and only rows not yet
+    in the index are vectorized.
+    """
+    global _synced
+    max_id, count = db.session.execute(
+        select(func.coalesce(func.max(CachedAnswer.id), 0), func.count(CachedAnswer.id))
+    ).one()
+    if (max_id, count) == _synced:
+        return
+
+    ids = set(db.session.execute(select(CachedAnswer.id)).scalars())
+    for entry_id in _vectors.keys() - ids:
+        del _vectors[entry_id]
+    new_ids = ids - _vectors.keys()
+    if new_ids:
+        rows = db.session.execute(
+            select(CachedAnswer.id, CachedAnswer.question).where(CachedAnswer.id.in_(new_ids))
+        ).all()
+        for row in rows:
+            _vectors[row.id] = _vectorize(row.question)
+    _synced = (max_id, count)
+
+
+def _best_match(vector: np.ndarray, names: FrozenSet[str]) -> Tuple[Optional[int], float]:
+    best_id, best_score = None, 0.0
+    for entry_id, (entry_vector, entry_names) in _vectors.items():
+        if entry_names != names:
+            continue
+        score = float(np.dot(vector, entry_vector))
+        if score > best_score:
+            best_id, best_score = entry_id, score
+    return best_id, best_score
+
+
+def lookup(question: str) -> Optional[Dict[str, Any]]:
+    """
+    Return a cached answer_question result for the question, or None.
+    """
+    if not ENABLED:
+        return None
+
+    try:
+        entry = CachedAnswer.query.filter_by(question_hash=question_hash(question)).first()
+        match = 'exact'
+
+        if entry is None:
+            if _embedder is None:
+                return None
+            with _lock:
+                _sync_vectors()
+                if not _vectors:
+                    return None
+                entry_id, score = _best_match(*_vectorize(question))
+            if entry_id is None or score < SIMILARITY_THRESHOLD:
+                return None
+            entry = db.session.get(CachedAnswer, entry_id)
+            if entry is None:
+                return None
+            match = f"similar ({score:.3f})"
+
+        logger.info(f"Answer cache hit, {match}: {question[:100]}")
+        return json.loads(entry.result)
+
+    except Exception as e:
+        logger.error(f"Error reading answer cache: {e}")
+        return None
+
+
+def store(question: str, result: Dict[str, Any]):
+    """
+    Cache an answer_question result.
+    """
+    if not ENABLED:
+        return
+
+    try:
+        key = question_hash(question)
+        if CachedAnswer.query.filter_by(question_hash=key).first() is not None:
+            return
+
+        db.session.add(CachedAnswer(question_hash=key, question=question, result=json.dumps(result)))
+        db.session.commit()
+
+        # Evict the oldest entries beyond the size bound
+        count = CachedAnswer.query.count()
+        if count > MAX_ENTRIES:
+            oldest = select(CachedAnswer.id).order_by(CachedAnswer.id).limit(count - MAX_ENTRIES)
+            db.session.execute(delete(CachedAnswer).where(CachedAnswer.id.in_(oldest)))
+            db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error writing answer cache: {e}")
+
+
+def clear():
+    """
+    Drop every cached answer.
+    """
+    db.session.execute(delete(CachedAnswer))
+    db.session.commit()
+
+
+@event.listens_for(ScrapedContent, 'after_insert')
+@event.listens_for(ScrapedContent, 'after_update')
+@event.listens_for(ScrapedContent, 'after_delete')
+def _invalidate_on_content_change(mapper, connection, target):
+    # Runs inside the content write's transaction, so all workers see it together
+    connection.execute(delete(CachedAnswer.__table__))
@@ -1,10 +1,12 @@
-from flask import request, jsonify
-import base64
+from flask import request, jsonify, Response, stream_with_context
 import time
 import json
 import logging
-from app import app, db
-from models import QuestionAnswer
+from app import app
+from analytics_writer import analytics_writer
+import stats_rollup
+import startup
+from image_pipeline import prepare_image, ImageError
 
 logger = logging.getLogger(__name__)
 
@@ -34,24 +36,22 @@ def handle_question():
                 "error": "Question is required"
             }), 400
         
-        image_base64 = data.get('image')
-        
-        # Validate image if provided
-        if image_base64:
+        # Validate, decode and downscale the image once, if provided
+        image = None
+        if data.get('image'):
             try:
-                # Validate base64 format
-                base64.b64decode(image_base64)
-            except Exception:
+                image = prepare_image(data['image'])
+            except ImageError as e:
                 return jsonify({
-                    "error": "Invalid base64 image data"
-                }), 400
+                    "error": str(e)
+                }), e.status
         
         logger.info(f"Processing question: {question[:100]}...")
         
         # Import AI assistant here to avoid circular imports
         try:
             from ai_assistant_simple import answer_question
-            result = answer_question(question, image_base64)
+            result = answer_question(question, image)
         except ImportError:
             # Fallback if AI assistant not available
             result = {
@@ -63,19 +63,9 @@ def handle_question():
         # Calculate response time
         response_time = time.time() - start_time
         
-        # Store in database for analytics
-        try:
-            qa_record = QuestionAnswer(
-                question=question,
-                answer=result['answer'],
-                links=json.dumps(result['links']),
-                has_image=bool(image_base64),
-                response_time=response_time
-            )
-            db.session.add(qa_record)
-            db.session.commit()
-        except Exception as e:
-            logger.error(f"Error saving to database: {e}")
+        # Queue for analytics; written in batches by a background thread
+        analytics_writer.record(question, result['answer'], result['links'],
+                                image is not None, response_time)
         
         logger.info(f"Question answered in {response_time:.2f} seconds")
         
@@ -90,6 +80,80 @@ def handle_question():
         }), 500
 
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/api/stream', methods=['POST'])
+def stream_question():
+    """
+    Streaming variant of the main endpoint using Server-Sent Events.
+    Takes the same JSON body and emits:
+        links   retrieved source links, as soon as search completes
+        token   a piece of the answer text
+        reset   discard the tokens so far (the answer is being regenerated)
+        done    {"source": ..., "response_time": ...}
+        error   {"error": ...}
+    """
+    start_time = time.time()
+    
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({
+            "error": "No JSON data provided"
+        }), 400
+    
+    question = data.get('question', '').strip()
+    if not question:
+        return jsonify({
+            "error": "Question is required"
+        }), 400
+    
+    image = None
+    if data.get('image'):
+        try:
+            image = prepare_image(data['image'])
+        except ImageError as e:
+            return jsonify({
+                "error": str(e)
+            }), e.status
+    
+    logger.info(f"Streaming answer to question: {question[:100]}...")
+    
+    def generate():
+        from ai_assistant_simple import stream_answer
+        
+        result = None
+        try:
+            for event, payload in stream_answer(question, image):
+                if event == 'done':
+                    result = payload
+                    break
+                yield _sse(event, payload)
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            yield _sse('error', {"error": f"Internal server error: {str(e)}"})
+            return
+        
+        response_time = time.time() - start_time
+        yield _sse('done', {
+            "source": result.get('source') if result else None,
+            "response_time": response_time
+        })
+        
+        # Queue for analytics once the client has the answer
+        if result:
+            analytics_writer.record(question, result['answer'], result['links'],
+                                    image is not None, response_time)
+        
+        logger.info(f"Question streamed in {response_time:.2f} seconds")
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable proxy buffering so events flush immediately
+    })
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """
@@ -101,25 +165,28 @@ def health_check():
     })
 
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness check endpoint.
+    Unlike /api/health, returns 503 until the database is initialized (and,
+    with STARTUP_WARMUP, the model and index are loaded), along with the
+    seconds from import to each startup stage.
+    """
+    status = startup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """
     Get API usage statistics.
+    Pass ?hours=N for per-hour figures over the last N hours.
     """
     try:
-        total_questions = QuestionAnswer.query.count()
-        questions_with_images = QuestionAnswer.query.filter_by(has_image=True).count()
-        
-        if total_questions > 0:
-            avg_response_time = db.session.query(db.func.avg(QuestionAnswer.response_time)).scalar()
-        else:
-            avg_response_time = 0.0
-        
-        return jsonify({
-            "total_questions": total_questions,
-            "questions_with_images": questions_with_images,
-            "average_response_time": round(avg_response_time, 2) if avg_response_time else 0.0
-        })
+        # Precomputed rollups: constant cost regardless of history size
+        hours = min(request.args.get('hours', 0, type=int), 24 * 7)
+        return jsonify(stats_rollup.get_stats(hours))
         
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
@@ -1,6 +1,9 @@
+import startup  # First, so import-to-ready timings start here
 import os
 import logging
-from flask import Flask
+import threading
+import time
+from flask import Flask, request
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
@@ -44,15 +47,59 @@ db.init_app(app)
 
 # Import models and routes
 import models
+import migrations
+import inverted_index
+import chunker
+import fts_search
+import answer_cache
+import stats_rollup
 import routes
 import api
 
-# Initialize database tables
-with app.app_context():
-    try:
-        db.create_all()
-        # Initialize sample data
-        from ai_assistant_simple import initialize_simple_data
-        initialize_simple_data()
-    except Exception as e:
-        app.logger.error(f"Database initialization error: {e}")
+_db_lock = threading.Lock()
+
+# Probes must answer while the database is still being initialized
+PROBE_ENDPOINTS = {'health_check', 'readiness_check', 'static'}
+
+
+def initialize_database():
+    """
+    Create tables, seed sample data and build the search indexes.
+    Runs once per process, on the first request rather than at import;
+    concurrent callers wait for the first one to finish. After a failure
+    the stage stays unready, so /api/ready keeps answering 503 and the next
+    request tries again.
+    """
+    if startup.is_ready('database'):
+        return
+    with _db_lock:
+        if startup.is_ready('database'):
+            return
+        started = time.perf_counter()
+        try:
+            with app.app_context():
+                db.create_all()
+                migrations.upgrade_schema()
+                # Initialize sample data
+                from ai_assistant_simple import initialize_simple_data
+                initialize_simple_data()
+                chunker.build_passages()
+                inverted_index.build_index()
+                fts_search.ensure_fts_table()
+                stats_rollup.backfill()
+        except Exception as e:
+            startup.fail('database', e)
+            app.logger.error(f"Database initialization error: {e}")
+            return
+        startup.mark('database', time.perf_counter() - started)
+
+
+@app.before_request
+def _initialize_on_first_request():
+    if not startup.is_ready('database') and request.endpoint not in PROBE_ENDPOINTS:
+        initialize_database()
+
+
+startup.mark('import', startup.since_import())
+if startup.WARMUP:
+    startup.start_warmup()
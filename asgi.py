@@ -0,0 +1,161 @@
+"""
+ASGI entry point with a non-blocking /api/ endpoint.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+POST /api/ is served natively on the event loop: the image is prepared in a
+worker thread while the passages are retrieved, analytics records are
+handed to the batched background writer, and the OpenAI call is awaited on
+the async client, so one process can keep hundreds of questions in flight.
+Every other route is handed to the Flask app unchanged.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from asgiref.wsgi import WsgiToAsgi
+from app import app as flask_app, initialize_database
+import startup
+from analytics_writer import analytics_writer
+from ai_assistant_simple import answer_question_async
+from image_pipeline import prepare_image, ImageError
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on questions being answered at once by this process
+MAX_IN_FLIGHT = int(os.environ.get('ASYNC_MAX_IN_FLIGHT', 500))
+MAX_BODY_BYTES = int(os.environ.get('ASYNC_MAX_BODY_BYTES', 20 * 1024 * 1024))
+
+wsgi_app = WsgiToAsgi(flask_app)
+_in_flight = None
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError("Client disconnected")
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise RequestTooLarge("Request body too large")
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _send_json(send, payload: dict, status: int = 200):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def handle_question(receive, send):
+    """
+    Async equivalent of api.handle_question, with the same request and
+    response format.
+    """
+    start_time = time.time()
+
+    body = await _read_body(receive)
+    try:
+        data = json.loads(body or b'null')
+    except ValueError:
+        await _send_json(send, {"error": "No JSON data provided"}, 400)
+        return
+
+    if not isinstance(data, dict) or not data:
+        await _send_json(send, {"error": "No JSON data provided"}, 400)
+        return
+
+    question = (data.get('question') or '').strip()
+    if not question:
+        await _send_json(send, {"error": "Question is required"}, 400)
+        return
+
+    logger.info(f"Processing question: {question[:100]}...")
+
+    try:
+        if not startup.is_ready('database'):
+            # First question of this process; Flask routes do this in before_request
+            await asyncio.to_thread(initialize_database)
+
+        async with _in_flight:
+            image = None
+            if data.get('image'):
+                # Decoding and downscaling are CPU work; run them off the loop,
+                # alongside retrieval, until the messages need the image
+                image = asyncio.ensure_future(asyncio.to_thread(prepare_image, data['image']))
+            try:
+                result = await answer_question_async(question, image)
+            except ImageError as e:
+                await _send_json(send, {"error": str(e)}, e.status)
+                return
+            finally:
+                # The answer may not have needed the image (e.g. retrieval failed)
+                if image is not None and not image.done():
+                    image.cancel()
+                elif image is not None and not image.cancelled():
+                    image.exception()  # Retrieved, so an unused ImageError is not logged
+
+        response_time = time.time() - start_time
+
+        # Queue for analytics; the background writer batches the inserts
+        analytics_writer.record(question, result['answer'], result['links'],
+                                image is not None, response_time)
+
+        logger.info(f"Question answered in {response_time:.2f} seconds")
+        await _send_json(send, result)
+
+    except Exception as e:
+        error_msg = f"Internal server error: {str(e)}"
+        logger.error(error_msg)
+        await _send_json(send, {"error": error_msg}, 500)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Write out queued analytics records
+            await asyncio.to_thread(analytics_writer.flush)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    global _in_flight
+    if _in_flight is None:
+        _in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    if scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/api/':
+        try:
+            await handle_question(receive, send)
+        except RequestTooLarge as e:
+            await _send_json(send, {"error": str(e)}, 413)
+        except ConnectionError:
+            pass
+        return
+
+    await wsgi_app(scope, receive, send)
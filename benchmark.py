@@ -0,0 +1,495 @@
+"""
+Benchmarks for the retrieval and answer pipeline on synthetic corpora.
+
+    python benchmark.py                          # 1k, 10k and 100k documents
+    python benchmark.py --sizes 1000 --queries 50
+    python benchmark.py --compare benchmark-<commit>.json
+
+Each corpus size runs in a fresh process with its own SQLite database and
+vector index in a temporary directory, so peak RSS and build times are those
+of that size alone. The corpus is deterministic (seeded) ScrapedContent with a
+Zipf-distributed vocabulary, and /api/ answers come from a stub
+OpenAI-compatible server started locally (OPENAI_BASE_URL), so only this
+code is measured.
+
+For every size the report has the corpus (passages and lexical index) and
+vector index build times, and for simple_search, VectorStore.search, hybrid
+search, POST /api/ (handle_question) and GET /api/stats (get_stats):
+latency percentiles over sequential calls, throughput from --concurrency
+threads and peak RSS. Results are written as JSON tagged with the git commit;
+--compare prints the change against an earlier file and exits with status 1
+if a metric got worse by more than --threshold.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; RSS is then not reported
+    resource = None
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+SEED = 42
+VOCABULARY_SIZE = 20000
+INSERT_BATCH_SIZE = 1000
+WARMUP_CALLS = 5
+
+# Settings recorded with the results, so runs under different configurations are told apart
+CONFIG_PREFIXES = ('VECTOR_', 'EMBED', 'RETRIEVAL_', 'HYBRID_', 'CONTEXT_', 'SEARCH_', 'PASSAGE_',
+                   'QUERY_CACHE', 'ANSWER_CACHE')
+
+# For --compare: whether a larger value of each metric is better
+HIGHER_IS_BETTER = {'qps'}
+
+_TOPICS = ('python', 'pandas', 'numpy', 'docker', 'github', 'regression', 'scraping', 'sqlite',
+           'duckdb', 'llm', 'embeddings', 'prompt', 'fastapi', 'vercel', 'deployment', 'assignment',
+           'deadline', 'project', 'notebook', 'visualization', 'excel', 'json', 'api', 'model',
+           'evaluation', 'dataset', 'cleaning', 'outliers', 'correlation', 'forecast')
+_SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'pa', 'qui', 'dra', 'fen',
+              'gor', 'hel', 'jin', 'mor', 'pol', 'ster', 'tan', 'ul', 'var', 'wen', 'yo')
+
+
+def vocabulary(size: int = VOCABULARY_SIZE, seed: int = SEED) -> List[str]:
+    """
+    Course topic words followed by made-up words, most frequent first.
+    """
+    rng = random.Random(seed)
+    words = list(_TOPICS)
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def _zipf_weights(size: int) -> List[float]:
+    weights, total = [], 0.0
+    for rank in range(1, size + 1):
+        total += 1.0 / rank ** 1.1
+        weights.append(total)
+    return weights
+
+
+def synthetic_documents(count: int, seed: int = SEED) -> Iterator[Dict]:
+    """
+    `count` ScrapedContent rows of 100-600 words in a few paragraphs.
+    """
+    rng = random.Random(seed)
+    words = vocabulary()
+    weights = _zipf_weights(len(words))
+    created = datetime(2025, 1, 1)
+    for i in range(count):
+        content_type = 'discourse' if rng.random() < 0.3 else 'course'
+        title = ' '.join(rng.choices(words[:2000], cum_weights=weights[:2000], k=rng.randint(3, 7))).title()
+        paragraphs = []
+        for _ in range(rng.randint(1, 5)):
+            sentence_words = rng.choices(words, cum_weights=weights, k=rng.randint(40, 120))
+            paragraphs.append(' '.join(sentence_words).capitalize() + '.')
+        yield {
+            'url': f"https://example.org/{content_type}/{i}",
+            'title': title,
+            'content': '\n\n'.join(paragraphs),
+            'content_type': content_type,
+            'scraped_at': created
+        }
+
+
+def synthetic_questions(count: int, seed: int) -> List[str]:
+    """
+    Keyword questions over the common (but not most common) corpus words.
+    """
+    rng = random.Random(seed)
+    words = vocabulary()[:2000]
+    weights = _zipf_weights(len(words))
+    templates = ("How do I use {} for the assignment?", "What is the difference between {}?",
+                 "Why does {} fail?", "{}")
+    return [rng.choice(templates).format(' '.join(rng.choices(words, cum_weights=weights, k=rng.randint(2, 5))))
+            for _ in range(count)]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of this process so far, in MB.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def measure(fn: Callable[[str], object], questions: List[str], concurrency: int) -> Dict:
+    """
+    After WARMUP_CALLS questions, latency percentiles of `fn` over the first
+    half of the rest called one at a time, and throughput over the second
+    half from `concurrency` threads. Distinct questions keep caches from
+    answering.
+    """
+    for question in questions[:WARMUP_CALLS]:
+        fn(question)
+    questions = questions[WARMUP_CALLS:]
+    half = len(questions) // 2
+
+    latencies = []
+    for question in questions[:half]:
+        started = time.perf_counter()
+        fn(question)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    pending = list(questions[half:])
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                question = pending.pop()
+            fn(question)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'calls': len(latencies),
+        'mean_ms': sum(latencies) / len(latencies),
+        'p50_ms': percentile(latencies, 0.50),
+        'p90_ms': percentile(latencies, 0.90),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': latencies[-1],
+        'qps': (len(questions) - half) / elapsed,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+class _StubLLMHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI chat completions endpoint with a fixed answer.
+    """
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        time.sleep(self.latency)
+        body = json.dumps({
+            'id': 'chatcmpl-benchmark',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'stub'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': 'This is a benchmark answer from the stub model.'},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 10, 'total_tokens': 10}
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_stub_llm(latency_ms: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Serve the stub model on a free local port in a background thread.
+    """
+    handler = type('StubLLMHandler', (_StubLLMHandler,), {'latency': latency_ms / 1000})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='stub-llm', daemon=True).start()
+    return server
+
+
+def build_corpus(size: int) -> Dict:
+    """
+    Insert the synthetic corpus and build its passages and lexical indexes.
+    """
+    from sqlalchemy import insert
+    from app import app, db, initialize_database
+    from models import ScrapedContent, ContentPassage
+    import chunker
+
+    initialize_database()
+    with app.app_context():
+        started = time.perf_counter()
+        batch = []
+        for document in synthetic_documents(size):
+            batch.append(document)
+            if len(batch) >= INSERT_BATCH_SIZE:
+                db.session.execute(insert(ScrapedContent), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(ScrapedContent), batch)
+        db.session.commit()
+        inserted_s = time.perf_counter() - started
+
+        # Chunking also fills the inverted index, and FTS5 through its triggers
+        chunker.build_passages()
+        passages = db.session.execute(db.select(db.func.count(ContentPassage.id))).scalar()
+
+    return {
+        'documents': size,
+        'passages': passages,
+        'insert_s': inserted_s,
+        'lexical_build_s': time.perf_counter() - started - inserted_s,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def run_size(size: int, queries: int, concurrency: int, skip_vector: bool) -> Dict:
+    """
+    Benchmark one corpus size in this process. Expects DATABASE_URL and the
+    working directory to be fresh.
+    """
+    from app import app
+    import ai_assistant_simple
+    import api  # noqa: F401  (registers the routes)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = {'build': build_corpus(size), 'retrievers': {}}
+    retrievers = result['retrievers']
+    seed = SEED
+
+    def in_context(fn):
+        def call(question):
+            with app.app_context():
+                return fn(question)
+        return call
+
+    def run(name, fn):
+        nonlocal seed
+        seed += 1
+        logger.warning(f"{size} documents: {name}")
+        retrievers[name] = measure(fn, synthetic_questions(queries + WARMUP_CALLS, seed), concurrency)
+
+    run('simple_search', in_context(ai_assistant_simple.simple_search))
+
+    if not skip_vector:
+        from vector_store import vector_store
+        import hybrid_search
+
+        started = time.perf_counter()
+        vector_store.create_index()
+        result['build']['vector_build_s'] = time.perf_counter() - started
+        result['build']['peak_rss_mb'] = peak_rss_mb()
+
+        run('vector_search', in_context(lambda question: vector_store.search(question, top_k=5)))
+        run('hybrid_search', hybrid_search.search)
+
+    clients = threading.local()
+
+    def client():
+        if not hasattr(clients, 'client'):
+            clients.client = app.test_client()
+        return clients.client
+
+    def handle_question(question):
+        response = client().post('/api/', json={'question': question})
+        if response.status_code != 200:
+            raise RuntimeError(f"POST /api/ returned {response.status_code}")
+
+    def get_stats(question):
+        response = client().get('/api/stats')
+        if response.status_code != 200:
+            raise RuntimeError(f"GET /api/stats returned {response.status_code}")
+
+    run('handle_question', handle_question)
+    run('get_stats', get_stats)
+    return result
+
+
+def git_commit() -> Dict:
+    """
+    The commit being benchmarked, and whether the tree has local changes.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def _run_worker(size: int, args, llm_url: str) -> Dict:
+    workdir = tempfile.mkdtemp(prefix=f'benchmark-{size}-')
+    output = os.path.join(workdir, 'result.json')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'benchmark.db')}",
+               OPENAI_API_KEY='benchmark',
+               OPENAI_BASE_URL=llm_url,
+               STARTUP_WARMUP='0')
+    env.pop('QUERY_CACHE_PATH', None)
+    command = [sys.executable, os.path.abspath(__file__), '--worker', str(size), '--worker-output', output,
+               '--queries', str(args.queries), '--concurrency', str(args.concurrency)]
+    if args.skip_vector:
+        command.append('--skip-vector')
+
+    try:
+        with open(os.path.join(workdir, 'benchmark.log'), 'w') as log:
+            started = time.perf_counter()
+            completed = subprocess.run(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if completed.returncode != 0:
+            with open(os.path.join(workdir, 'benchmark.log')) as log:
+                tail = log.read()[-2000:]
+            raise RuntimeError(f"Benchmark of {size} documents failed:\n{tail}")
+        with open(output) as f:
+            result = json.load(f)
+        result['wall_s'] = time.perf_counter() - started
+        return result
+    finally:
+        if args.keep:
+            print(f"Kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(report: Dict):
+    for size, result in report['results'].items():
+        build = result['build']
+        print(f"\n{size} documents, {build['passages']} passages: insert {build['insert_s']:.1f}s, "
+              f"lexical index {build['lexical_build_s']:.1f}s"
+              + (f", vector index {build['vector_build_s']:.1f}s" if 'vector_build_s' in build else '')
+              + (f", peak RSS {build['peak_rss_mb']:.0f} MB" if build['peak_rss_mb'] else ''))
+        print(f"{'':<16}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'qps':>9}{'RSS MB':>9}")
+        for name, row in result['retrievers'].items():
+            rss = f"{row['peak_rss_mb']:>9.0f}" if row['peak_rss_mb'] else f"{'-':>9}"
+            print(f"{name:<16}{row['p50_ms']:>9.2f}{row['p90_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+                  f"{row['qps']:>9.1f}{rss}")
+
+
+def _metrics(report: Dict) -> Dict[str, float]:
+    """
+    Flatten a report into 'size/stage/metric' -> value.
+    """
+    flat = {}
+    for size, result in report['results'].items():
+        for key in ('insert_s', 'lexical_build_s', 'vector_build_s', 'peak_rss_mb'):
+            if result['build'].get(key) is not None:
+                flat[f"{size}/build/{key}"] = result['build'][key]
+        for name, row in result['retrievers'].items():
+            for key in ('p50_ms', 'p90_ms', 'p99_ms', 'qps', 'peak_rss_mb'):
+                if row.get(key) is not None:
+                    flat[f"{size}/{name}/{key}"] = row[key]
+    return flat
+
+
+def compare(baseline: Dict, report: Dict, threshold: float) -> List[str]:
+    """
+    Print the change of every metric present in both reports and return
+    those that got worse by more than `threshold` (a fraction).
+    """
+    old, new = _metrics(baseline), _metrics(report)
+    print(f"\nCompared with {(baseline.get('git') or {}).get('commit') or 'baseline'}:")
+    print(f"{'metric':<40}{'before':>11}{'after':>11}{'change':>9}")
+    regressions = []
+    for key in sorted(old.keys() & new.keys(), key=lambda k: (int(k.split('/')[0]), k)):
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key]
+        worse = -change if key.rsplit('/', 1)[1] in HIGHER_IS_BETTER else change
+        flag = ''
+        if worse > threshold:
+            regressions.append(key)
+            flag = '  regression'
+        print(f"{key:<40}{old[key]:>11.2f}{new[key]:>11.2f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval and answering on synthetic corpora")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="Corpus sizes in documents")
+    parser.add_argument('--queries', type=int, default=200, help="Calls per retriever and size")
+    parser.add_argument('--concurrency', type=int, default=8, help="Threads for the throughput runs")
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help="Delay of each stub LLM answer")
+    parser.add_argument('--skip-vector', action='store_true', help="Skip the vector index and searches")
+    parser.add_argument('--output', help="Results file (default benchmark-<commit>.json)")
+    parser.add_argument('--compare', help="Earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Relative change counted as a regression by --compare")
+    parser.add_argument('--keep', action='store_true', help="Keep each size's working directory")
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_size(args.worker, args.queries, args.concurrency, args.skip_vector)
+        with open(args.worker_output, 'w') as f:
+            json.dump(result, f)
+        return
+
+    server = start_stub_llm(args.llm_latency_ms)
+    llm_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    git = git_commit()
+    report = {
+        'git': git,
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {
+            'queries': args.queries,
+            'concurrency': args.concurrency,
+            'llm_latency_ms': args.llm_latency_ms,
+            'skip_vector': args.skip_vector,
+            'env': {key: value for key, value in os.environ.items() if key.startswith(CONFIG_PREFIXES)}
+        },
+        'results': {}
+    }
+    try:
+        for size in args.sizes:
+            print(f"Benchmarking {size} documents...", flush=True)
+            report['results'][str(size)] = _run_worker(size, args, llm_url)
+    finally:
+        server.shutdown()
+
+    output = args.output or f"benchmark-{(git['commit'] or 'unknown')[:12]}{'-dirty' if git['dirty'] else ''}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Split scraped content into overlapping passages for retrieval.
+
+Passages are stored in their own table, linked to the parent ScrapedContent
+row, and are rewritten (along with their inverted index postings) whenever the
+parent is inserted, updated or deleted.
+"""
+import logging
+import os
+from typing import List, Tuple
+from sqlalchemy import event, delete, insert, inspect, select
+from app import db
+from models import ScrapedContent, ContentPassage
+import inverted_index
+
+logger = logging.getLogger(__name__)
+
+# Passage size and overlap in characters
+CHUNK_SIZE = int(os.environ.get('PASSAGE_CHUNK_SIZE', 800))
+CHUNK_OVERLAP = int(os.environ.get('PASSAGE_CHUNK_OVERLAP', 150))
+
+# Preferred break points, strongest first
+_BREAKS = ['\n\n', '\n', '. ', '? ', '! ', '; ', ' ']
+
+
+def _find_break(text: str, start: int, end: int) -> int:
+    """
+    Find the best place to end a chunk in text[start:end], favouring paragraph
+    and sentence boundaries in the second half of the window.
+    """
+    floor = start + (end - start) // 2
+    for separator in _BREAKS:
+        pos = text.rfind(separator, floor, end)
+        if pos != -1:
+            return pos + len(separator)
+    return end
+
+
+def chunk_text(text: str, size: int = None, overlap: int = None) -> List[Tuple[int, int, str]]:
+    """
+    Split text into (start, end, passage) chunks of at most `size` characters,
+    each overlapping the previous one by roughly `overlap` characters.
+    """
+    size = size or CHUNK_SIZE
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    if overlap >= size:
+        raise ValueError("Chunk overlap must be smaller than chunk size")
+
+    chunks = []
+    length = len(text)
+    start = 0
+    while start < length:
+        end = min(start + size, length)
+        if end < length:
+            end = _find_break(text, start, end)
+
+        passage = text[start:end].strip()
+        if passage:
+            chunks.append((start, end, passage))
+
+        if end >= length:
+            break
+
+        # Step back by the overlap, then forward to the next word boundary
+        next_start = max(end - overlap, start + 1)
+        space = text.find(' ', next_start, end)
+        start = space + 1 if space != -1 else next_start
+
+    return chunks
+
+
+def store_passages(connection, content_id: int, title: str, content: str):
+    """
+    Replace the passages (and their postings) for one ScrapedContent row.
+    """
+    remove_passages(connection, content_id)
+
+    for position, (start, end, passage) in enumerate(chunk_text(content or "")):
+        result = connection.execute(
+            insert(ContentPassage.__table__).values(
+                content_id=content_id,
+                position=position,
+                start_offset=start,
+                end_offset=end,
+                title=title,
+                text=passage
+            )
+        )
+        inverted_index.index_passage(connection, result.inserted_primary_key[0], title, passage)
+
+
+def remove_passages(connection, content_id: int):
+    """
+    Delete the passages (and their postings) for one ScrapedContent row.
+    """
+    passage_ids = connection.execute(
+        select(ContentPassage.id).where(ContentPassage.content_id == content_id)
+    ).scalars().all()
+    if passage_ids:
+        inverted_index.remove_passages(connection, passage_ids)
+        connection.execute(delete(ContentPassage.__table__).where(ContentPassage.content_id == content_id))
+
+
+@event.listens_for(ScrapedContent, 'after_insert')
+def _chunk_on_insert(mapper, connection, target):
+    store_passages(connection, target.id, target.title, target.content)
+
+
+@event.listens_for(ScrapedContent, 'after_update')
+def _chunk_on_update(mapper, connection, target):
+    history_changed = any(
+        inspect(target).attrs[attr].history.has_changes() for attr in ('title', 'content')
+    )
+    if history_changed:
+        store_passages(connection, target.id, target.title, target.content)
+
+
+@event.listens_for(ScrapedContent, 'after_delete')
+def _chunk_on_delete(mapper, connection, target):
+    remove_passages(connection, target.id)
+
+
+def build_passages() -> int:
+    """
+    Chunk every ScrapedContent row that has no passages yet.
+    Returns the number of rows chunked.
+    """
+    missing = (
+        select(ScrapedContent.id, ScrapedContent.title, ScrapedContent.content)
+        .outerjoin(ContentPassage, ContentPassage.content_id == ScrapedContent.id)
+        .where(ContentPassage.id.is_(None))
+    )
+
+    connection = db.session.connection()
+    chunked = 0
+    for row in db.session.execute(missing).all():
+        store_passages(connection, row.id, row.title, row.content)
+        chunked += 1
+
+    db.session.commit()
+    if chunked:
+        logger.info(f"Chunked {chunked} documents into passages")
+    return chunked
@@ -0,0 +1,187 @@
+"""
+Token-budgeted prompt context assembly.
+
+Retrieved passages are packed into the prompt in ranking order:
+
+    1. passages that are near-duplicates of one already packed (SimHash of
+       word 3-shingles within DEDUP_MAX_DISTANCE bits) are skipped; Discourse
+       threads often quote or repeat the same answer;
+    2. each remaining passage is added if it fits in what is left of
+       CONTEXT_TOKEN_BUDGET, otherwise later (shorter) ones are tried;
+    3. if not even the best passage fits, it is truncated to the budget.
+
+Tokens are counted with tiktoken when it is installed, otherwise estimated
+locally. Each call logs the tokens saved compared to sending every candidate.
+"""
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # Optional; token counts fall back to an estimate
+    tiktoken = None
+
+TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 1500))
+TOKENIZER_ENCODING = os.environ.get('CONTEXT_TOKENIZER', 'o200k_base')  # gpt-4o and gpt-4o-mini
+DEDUP_MAX_DISTANCE = int(os.environ.get('CONTEXT_DEDUP_DISTANCE', 8))  # Of 64 SimHash bits
+SHINGLE_SIZE = 3
+MIN_TRUNCATED_TOKENS = 32  # Shorter truncated passages are not worth sending
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_WORD_RE = re.compile(r"\w+")
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'requests': 0, 'candidate_tokens': 0, 'tokens': 0, 'duplicates': 0, 'dropped': 0}
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded and tiktoken is not None:
+                try:
+                    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                except Exception as e:
+                    # The BPE file is downloaded on first use and may be unavailable
+                    logger.warning(f"tiktoken encoding {TOKENIZER_ENCODING} unavailable, estimating tokens: {e}")
+            _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """
+    Number of tokens in text: exact with tiktoken, otherwise an estimate
+    of one token per punctuation mark and per 4 characters of a word.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECE_RE.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    The longest prefix of text within max_tokens, cut at a word boundary.
+    """
+    marker = ' ...'
+    max_tokens -= count_tokens(marker)
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        prefix = encoding.decode(tokens[:max_tokens])
+    else:
+        used = 0
+        end = 0
+        for match in _PIECE_RE.finditer(text):
+            used += math.ceil(len(match.group()) / 4)
+            if used > max_tokens:
+                break
+            end = match.end()
+        else:
+            return text
+        prefix = text[:end]
+    # Drop a partial trailing word
+    cut = prefix.rfind(' ')
+    return (prefix[:cut] if cut > 0 else prefix).rstrip() + marker
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of the text's word shingles; similar texts differ in few bits.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) > SHINGLE_SIZE:
+        features = [' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    else:
+        features = [' '.join(words)]
+
+    weights = [0] * 64
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def pack(passages: List[Dict], render: Callable[[Dict], str], separator: str = "\n\n",
+         budget: Optional[int] = None) -> Dict:
+    """
+    Pack best-first passages into a context string of at most `budget`
+    tokens (CONTEXT_TOKEN_BUDGET by default). `render` formats one passage.
+
+    Returns the context, the packed passages, and token accounting:
+    candidate_tokens (every passage rendered), tokens (the context),
+    tokens_saved, duplicates and dropped (did not fit) counts.
+    """
+    budget = budget or TOKEN_BUDGET
+    separator_tokens = count_tokens(separator)
+
+    rendered = [render(passage) for passage in passages]
+    sizes = [count_tokens(text) for text in rendered]
+    candidate_tokens = sum(sizes) + separator_tokens * max(len(rendered) - 1, 0)
+
+    packed, parts, fingerprints = [], [], []
+    used = duplicates = dropped = 0
+    for passage, text, size in zip(passages, rendered, sizes):
+        fingerprint = simhash(passage.get('content') or text)
+        if any(hamming(fingerprint, other) <= DEDUP_MAX_DISTANCE for other in fingerprints):
+            duplicates += 1
+            continue
+
+        cost = size + (separator_tokens if parts else 0)
+        if used + cost > budget:
+            if parts or budget < MIN_TRUNCATED_TOKENS:
+                dropped += 1
+                continue
+            # The best passage alone is over budget: send as much of it as fits
+            text = truncate_tokens(text, budget)
+            cost = count_tokens(text)
+
+        packed.append(passage)
+        parts.append(text)
+        fingerprints.append(fingerprint)
+        used += cost
+
+    context = separator.join(parts)
+    tokens = count_tokens(context) if parts else 0
+    report = {
+        'candidate_tokens': candidate_tokens,
+        'tokens': tokens,
+        'tokens_saved': max(candidate_tokens - tokens, 0),
+        'duplicates': duplicates,
+        'dropped': dropped
+    }
+    with _stats_lock:
+        _stats['requests'] += 1
+        for key in ('candidate_tokens', 'tokens', 'duplicates', 'dropped'):
+            _stats[key] += report[key]
+
+    logger.info(f"Packed {len(packed)} of {len(passages)} passages into {tokens}/{budget} tokens "
+                f"({report['tokens_saved']} saved, {duplicates} near-duplicates, {dropped} over budget)")
+    return dict(report, context=context, passages=packed)
+
+
+def stats() -> Dict:
+    """
+    Totals since startup, for monitoring.
+    """
+    with _stats_lock:
+        totals = dict(_stats)
+    totals['tokens_saved'] = totals['candidate_tokens'] - totals['tokens']
+    return totals
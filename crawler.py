@@ -0,0 +1,464 @@
+"""
+Concurrent crawl engine used by scraper.py.
+
+Pages are fetched by a thread pool, with a token bucket per host so that
+concurrency never turns into hammering a single server. robots.txt is
+honored (including Crawl-delay), 429 and 5xx responses are retried with
+jittered exponential backoff that respects Retry-After, and HTML extraction
+runs in a process pool so it does not serialize on the GIL. Extracted pages
+are bulk-inserted into ScrapedContent.
+
+Re-crawls are incremental: stored pages are fetched with If-None-Match /
+If-Modified-Since, so an unchanged page costs a 304 and no extraction, and a
+page whose extracted content hash differs is updated in place and re-embedded
+on its own.
+
+Everything goes through a requests.Session, so the crawler can be pointed at
+a local fixture server:
+
+    crawler = Crawler(rate=100)
+    records = crawler.crawl(['http://127.0.0.1:8000/page1'], content_type='course')
+    save_records(records)
+"""
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+import requests
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = int(os.environ.get('CRAWL_CONCURRENCY', 8))
+RATE_PER_HOST = float(os.environ.get('CRAWL_RATE_PER_HOST', 1.0))  # Requests per second
+BURST = int(os.environ.get('CRAWL_BURST', 2))
+MAX_RETRIES = int(os.environ.get('CRAWL_MAX_RETRIES', 3))
+TIMEOUT = float(os.environ.get('CRAWL_TIMEOUT', 20))
+USER_AGENT = os.environ.get('CRAWL_USER_AGENT', 'TDS-Virtual-TA-Crawler/1.0')
+EXTRACT_WORKERS = int(os.environ.get('CRAWL_EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+MAX_RETRY_AFTER = 300.0  # Give up on a URL rather than wait longer than this
+SAVE_BATCH_SIZE = 100
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, with bursts of up to
+    `burst`. pause() blocks all acquisitions for a while, e.g. after a 429.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self.updated:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.updated - now  # Paused
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.tokens = 0.0
+            self.updated = max(self.updated, time.monotonic() + seconds)
+
+
+class HostRateLimiter:
+    """
+    One token bucket per host.
+    """
+
+    def __init__(self, rate: float = RATE_PER_HOST, burst: int = BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return self._buckets[host]
+
+    def set_rate(self, url: str, rate: float):
+        bucket = self.bucket(url)
+        with bucket._lock:
+            bucket.rate = rate
+
+    def acquire(self, url: str):
+        self.bucket(url).acquire()
+
+    def pause(self, url: str, seconds: float):
+        self.bucket(url).pause(seconds)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP-date).
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_document(html: str) -> Tuple[str, str]:
+    """
+    Extract (title, text) from an HTML page. Runs in the extraction process
+    pool, so it must stay a picklable top-level function.
+    """
+    title = ''
+    try:
+        import trafilatura
+        text = trafilatura.extract(html) or ''
+        metadata = trafilatura.extract_metadata(html)
+        if metadata is not None and metadata.title:
+            title = metadata.title
+    except ImportError:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
+        if soup.title and soup.title.string:
+            title = soup.title.string.strip()
+        for tag in soup(['script', 'style', 'nav', 'header', 'footer']):
+            tag.decompose()
+        text = soup.get_text('\n', strip=True)
+
+    if not title:
+        for line in text.split('\n'):
+            line = line.strip()
+            if line and len(line) < 100:  # Reasonable title length
+                title = line
+                break
+    return title[:200], text
+
+
+class Crawler:
+    def __init__(self, concurrency: int = CONCURRENCY, rate: float = RATE_PER_HOST, burst: int = BURST,
+                 max_retries: int = MAX_RETRIES, extract_workers: int = EXTRACT_WORKERS,
+                 user_agent: str = USER_AGENT, session: Optional[requests.Session] = None,
+                 respect_robots: bool = True):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.extract_workers = extract_workers
+        self.user_agent = user_agent
+        self.respect_robots = respect_robots
+        self.limiter = HostRateLimiter(rate, burst)
+        if session is None:
+            session = requests.Session()
+            # Let every worker thread keep a connection to the host
+            adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        self.session.headers['User-Agent'] = user_agent
+        self._robots: Dict[str, Future] = {}
+        self._robots_lock = threading.Lock()
+
+    def _robots_for(self, url: str) -> Optional[RobotFileParser]:
+        parsed = urlparse(url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        with self._robots_lock:
+            pending = self._robots.get(origin)
+            fetching = pending is None
+            if fetching:
+                pending = self._robots[origin] = Future()
+        if not fetching:
+            # Another thread is fetching it; other hosts are not held up
+            return pending.result()
+
+        # A missing or unreachable robots.txt allows everything
+        parser = None
+        try:
+            self.limiter.acquire(url)
+            response = self.session.get(f"{origin}/robots.txt", timeout=TIMEOUT)
+            if response.status_code == 200:
+                parser = RobotFileParser()
+                parser.parse(response.text.splitlines())
+                delay = parser.crawl_delay(self.user_agent)
+                if delay:
+                    self.limiter.set_rate(url, min(self.limiter.rate, 1.0 / float(delay)))
+        except requests.RequestException as e:
+            logger.warning(f"Could not fetch robots.txt for {origin}: {e}")
+        except Exception as e:
+            logger.error(f"Error reading robots.txt for {origin}: {e}")
+            parser = None
+        finally:
+            pending.set_result(parser)
+        return parser
+
+    def allowed(self, url: str) -> bool:
+        if not self.respect_robots:
+            return True
+        parser = self._robots_for(url)
+        return parser is None or parser.can_fetch(self.user_agent, url)
+
+    def fetch(self, url: str, headers: Optional[Dict] = None) -> Optional[requests.Response]:
+        """
+        GET a URL with per-host rate limiting and retries.
+        Returns the final response, or None if it was disallowed or failed.
+        """
+        if not self.allowed(url):
+            logger.info(f"Disallowed by robots.txt: {url}")
+            return None
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(url)
+            retry_after = None
+            try:
+                response = self.session.get(url, headers=headers, timeout=TIMEOUT)
+                if response.status_code not in RETRYABLE_STATUS:
+                    return response
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = str(e)
+
+            if attempt == self.max_retries:
+                logger.error(f"Giving up on {url} after {attempt + 1} attempts: {error}")
+                return None
+            if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+                logger.error(f"Giving up on {url}: Retry-After of {retry_after:.0f}s")
+                return None
+
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+                # The server asked the whole host to slow down, not just this URL
+                self.limiter.pause(url, retry_after)
+            logger.warning(f"Fetching {url} failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def _fetch_page(self, url: str, validators: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Fetch a page, conditionally if validators from an earlier fetch are known.
+        Returns None on failure and {'not_modified': True} on a 304.
+        """
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        response = self.fetch(url, headers=headers)
+        if response is None:
+            return None
+        if response.status_code == 304:
+            return {'not_modified': True}
+        if response.status_code != 200:
+            logger.warning(f"Skipping {url}: HTTP {response.status_code}")
+            return None
+        return {
+            'html': response.text,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
+
+    def crawl(self, urls: Iterable[str], content_type: str,
+              extractor: Callable[[str], Tuple[str, str]] = extract_document,
+              validators: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+        """
+        Fetch and extract URLs concurrently.
+        `validators` maps already-stored URLs to their etag/last_modified, so
+        they are re-fetched conditionally and unchanged pages are skipped
+        without extraction. Returns ScrapedContent field dicts for the pages
+        that were fetched and had content.
+        """
+        urls = list(dict.fromkeys(urls))
+        validators = validators or {}
+        records = []
+        not_modified = 0
+        started = time.time()
+
+        extract_pool = ProcessPoolExecutor(self.extract_workers) if self.extract_workers > 0 else None
+        try:
+            with ThreadPoolExecutor(self.concurrency) as fetch_pool:
+                fetches = {fetch_pool.submit(self._fetch_page, url, validators.get(url)): url for url in urls}
+                extractions = {}
+                for future in as_completed(fetches):
+                    url = fetches[future]
+                    try:
+                        page = future.result()
+                    except Exception as e:
+                        # One bad page must not cost the rest of the crawl
+                        logger.error(f"Error fetching {url}: {e}")
+                        continue
+                    if page is None:
+                        continue
+                    if page.get('not_modified'):
+                        not_modified += 1
+                        continue
+                    if not page['html']:
+                        continue
+                    # Extract while the remaining fetches are still in flight
+                    if extract_pool is not None:
+                        extractions[extract_pool.submit(extractor, page['html'])] = (url, page)
+                    else:
+                        records.append(self._record(url, content_type, page, extractor(page['html'])))
+
+            for future in as_completed(extractions):
+                url, page = extractions[future]
+                try:
+                    records.append(self._record(url, content_type, page, future.result()))
+                except Exception as e:
+                    logger.error(f"Error extracting content from {url}: {e}")
+        finally:
+            if extract_pool is not None:
+                extract_pool.shutdown()
+
+        records = [record for record in records if record['content']]
+        logger.info(f"Crawled {len(urls)} URLs, {len(records)} with content, "
+                    f"{not_modified} not modified, in {time.time() - started:.1f}s")
+        return records
+
+    @staticmethod
+    def _record(url: str, content_type: str, page: Dict, extracted: Tuple[str, str]) -> Dict:
+        title, content = extracted
+        return {
+            'url': url,
+            'title': title or url.rstrip('/').split('/')[-1],
+            'content': content,
+            'content_type': content_type,
+            'etag': page.get('etag'),
+            'last_modified': page.get('last_modified'),
+            'content_hash': content_hash(content)
+        }
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def stored_validators(urls: List[str]) -> Dict[str, Dict]:
+    """
+    etag/last_modified of the given URLs that are already stored, for crawl().
+    Call inside an app context.
+    """
+    from app import db
+    from models import ScrapedContent
+
+    rows = db.session.execute(
+        db.select(ScrapedContent.url, ScrapedContent.etag, ScrapedContent.last_modified)
+        .where(ScrapedContent.url.in_(urls))
+    ).all()
+    return {row.url: {'etag': row.etag, 'last_modified': row.last_modified} for row in rows}
+
+
+def _reembed(contents: List) -> bool:
+    """
+    Re-embed changed documents in the vector store, if it is installed.
+    Imported lazily: loading it pulls in the embedding model.
+    Returns whether anything was re-embedded.
+    """
+    try:
+        from vector_store import vector_store
+    except ImportError as e:
+        logger.info(f"Vector store not available, skipping re-embedding: {e}")
+        return False
+    try:
+        vector_store.update_documents(contents)
+        logger.info(f"Re-embedded {len(contents)} changed documents")
+        return True
+    except Exception as e:
+        logger.error(f"Error re-embedding changed documents: {e}")
+        return False
+
+
+def _publish_reembedded():
+    """
+    Checkpoint the vector store after re-embedding. The new vectors are only
+    in this process's write-ahead log until then; serving workers pick up
+    the new generation on their next reload check.
+    """
+    from vector_store import vector_store
+    try:
+        vector_store.checkpoint()
+    except Exception as e:
+        logger.error(f"Error checkpointing re-embedded documents: {e}")
+
+
+def save_records(records: List[Dict], batch_size: int = SAVE_BATCH_SIZE) -> int:
+    """
+    Store crawled records in ScrapedContent, in batches.
+
+    New URLs are inserted and changed pages are updated in place, both
+    through the ORM so the passage, index and cache listeners still run;
+    changed pages are then re-embedded in the vector store, which is
+    checkpointed once at the end so serving workers see them. Pages whose
+    content hash is unchanged only get their validators refreshed.
+    Returns the number of rows added or changed.
+    """
+    from app import app, db
+    from models import ScrapedContent
+
+    added = changed = 0
+    reembedded = False
+    with app.app_context():
+        for i in range(0, len(records), batch_size):
+            batch = records[i:i + batch_size]
+            try:
+                existing = {
+                    row.url: row for row in db.session.execute(
+                        db.select(ScrapedContent).where(ScrapedContent.url.in_([r['url'] for r in batch]))
+                    ).scalars()
+                }
+                new_rows, updated = [], []
+                for record in batch:
+                    row = existing.get(record['url'])
+                    if row is None:
+                        new_rows.append(ScrapedContent(**record))
+                    elif row.content_hash == record['content_hash']:
+                        # Bulk UPDATE skips the mapper events: nothing to re-index
+                        db.session.execute(
+                            db.update(ScrapedContent)
+                            .where(ScrapedContent.id == row.id)
+                            .values(etag=record['etag'], last_modified=record['last_modified'])
+                        )
+                    else:
+                        for field in ('title', 'content', 'etag', 'last_modified', 'content_hash'):
+                            setattr(row, field, record[field])
+                        row.scraped_at = datetime.utcnow()
+                        updated.append(row)
+                db.session.add_all(new_rows)
+                db.session.commit()
+                added += len(new_rows)
+                changed += len(updated)
+
+                if updated and _reembed(updated):
+                    reembedded = True
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error saving crawled content: {e}")
+        if reembedded:
+            _publish_reembedded()
+    logger.info(f"Saved {added} new and {changed} changed pages")
+    return added + changed
@@ -0,0 +1,240 @@
+"""
+Discourse ingestion through the forum's JSON API.
+
+Instead of rendering topic pages and running HTML extraction, the ingester:
+
+    1. walks the category's /l/latest.json pages, newest activity first,
+       stopping once topics were last bumped before the date window;
+    2. reads each topic's post id stream from /t/{id}.json;
+    3. fetches the posts with raw markdown from /t/{id}/posts.json,
+       POSTS_PER_REQUEST ids at a time;
+    4. keeps the posts created inside the window as DiscoursePost rows and
+       stores each topic's posts as one ScrapedContent row.
+
+Requests go through the crawler, so they share its per-host rate limiter,
+robots.txt handling and retries. Pass a requests.Session (e.g. one serving
+recorded JSON fixtures) to run without the network:
+
+    DiscourseIngester(base_url, session=fixture_session).ingest('2025-01-01', '2025-04-14')
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+import requests
+from app import app, db, initialize_database
+from models import ScrapedContent, DiscoursePost
+from crawler import Crawler, save_records, content_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://discourse.onlinedegree.iitm.ac.in"
+DEFAULT_CATEGORY = "tools-in-data-science/6"
+POSTS_PER_REQUEST = 20  # Discourse's page size for post_ids[] lookups
+MAX_PAGES = int(os.environ.get('DISCOURSE_MAX_PAGES', 100))
+
+# Optional credentials for forums that require login
+API_KEY = os.environ.get('DISCOURSE_API_KEY')
+API_USERNAME = os.environ.get('DISCOURSE_API_USERNAME')
+SESSION_COOKIE = os.environ.get('DISCOURSE_COOKIE')  # Value of the _t cookie
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse a Discourse ISO-8601 timestamp ('2025-01-15T10:20:30.123Z') as naive UTC.
+    """
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+
+
+class DiscourseIngester:
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, category: str = DEFAULT_CATEGORY,
+                 session: Optional[requests.Session] = None, crawler: Optional[Crawler] = None):
+        self.base_url = base_url.rstrip('/')
+        self.category = category.strip('/')
+        if crawler is None:
+            if session is None:
+                session = requests.Session()
+            if API_KEY:
+                session.headers['Api-Key'] = API_KEY
+                session.headers['Api-Username'] = API_USERNAME or 'system'
+            if SESSION_COOKIE:
+                session.cookies.set('_t', SESSION_COOKIE)
+            crawler = Crawler(session=session, extract_workers=0)
+        self.crawler = crawler
+
+    def _get_json(self, path: str, params=None) -> Optional[Dict]:
+        url = f"{self.base_url}{path}"
+        if params:
+            url = requests.Request('GET', url, params=params).prepare().url
+        response = self.crawler.fetch(url, headers={'Accept': 'application/json'})
+        if response is None:
+            return None
+        if response.status_code != 200:
+            logger.warning(f"Skipping {url}: HTTP {response.status_code}")
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            logger.error(f"Invalid JSON from {url}")
+            return None
+
+    def topics(self, start: datetime, end: datetime) -> Iterator[Dict]:
+        """
+        Topics of the category that may have posts inside [start, end).
+        """
+        for page in range(MAX_PAGES):
+            data = self._get_json(f"/c/{self.category}/l/latest.json", {'page': page})
+            topics = (data or {}).get('topic_list', {}).get('topics', [])
+            if not topics:
+                return
+
+            active = False
+            for topic in topics:
+                bumped_at = parse_timestamp(topic.get('bumped_at') or topic.get('last_posted_at'))
+                created_at = parse_timestamp(topic.get('created_at'))
+                if bumped_at and bumped_at < start:
+                    continue  # Includes old pinned topics, which are listed first
+                active = True
+                if created_at is None or created_at < end:
+                    yield topic
+
+            # Topics are ordered by last activity, so the window has been passed
+            if not active or not data['topic_list'].get('more_topics_url'):
+                return
+
+    def posts(self, topic_id: int, start: datetime, end: datetime) -> List[Dict]:
+        """
+        Posts of a topic created inside [start, end), with raw markdown.
+        """
+        topic = self._get_json(f"/t/{topic_id}.json")
+        if not topic:
+            return []
+        stream = topic.get('post_stream', {}).get('stream', [])
+
+        posts = []
+        for i in range(0, len(stream), POSTS_PER_REQUEST):
+            chunk = stream[i:i + POSTS_PER_REQUEST]
+            data = self._get_json(f"/t/{topic_id}/posts.json",
+                                  {'post_ids[]': chunk, 'include_raw': 'true'})
+            for post in (data or {}).get('post_stream', {}).get('posts', []):
+                created_at = parse_timestamp(post.get('created_at'))
+                if created_at is not None and start <= created_at < end:
+                    posts.append(post)
+        return posts
+
+    def _fetch_topic(self, topic: Dict, start: datetime, end: datetime) -> Optional[Dict]:
+        try:
+            return {'topic': topic, 'posts': self.posts(topic['id'], start, end)}
+        except Exception as e:
+            logger.error(f"Error fetching Discourse topic {topic.get('id')}: {e}")
+            return None
+
+    def topic_url(self, topic: Dict) -> str:
+        return f"{self.base_url}/t/{topic.get('slug') or 'topic'}/{topic['id']}"
+
+    def ingest(self, start_date: str, end_date: str) -> int:
+        """
+        Ingest posts created between start_date and end_date (inclusive,
+        'YYYY-MM-DD'). Returns the number of topics added or changed.
+        """
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+        initialize_database()
+
+        topics = list(self.topics(start, end))
+        logger.info(f"Found {len(topics)} Discourse topics active since {start_date}")
+
+        with ThreadPoolExecutor(self.crawler.concurrency) as pool:
+            fetched = [result for result in pool.map(lambda t: self._fetch_topic(t, start, end), topics)
+                       if result and result['posts']]
+
+        with app.app_context():
+            for result in fetched:
+                self._store_posts(result['topic']['id'], result['posts'])
+            records = [self._topic_record(result['topic']) for result in fetched]
+            records = [record for record in records if record['content']]
+
+        saved = save_records(records)
+
+        with app.app_context():
+            self._link_posts({self.topic_url(result['topic']): result['topic']['id'] for result in fetched})
+
+        logger.info(f"Ingested {sum(len(r['posts']) for r in fetched)} posts from {len(fetched)} topics")
+        return saved
+
+    def _store_posts(self, topic_id: int, posts: List[Dict]):
+        """
+        Insert new posts and refresh edited ones.
+        """
+        try:
+            existing = {
+                post.id: post for post in db.session.execute(
+                    db.select(DiscoursePost).where(DiscoursePost.id.in_([p['id'] for p in posts]))
+                ).scalars()
+            }
+            for post in posts:
+                raw = post.get('raw') or ''
+                updated_at = parse_timestamp(post.get('updated_at'))
+                row = existing.get(post['id'])
+                if row is None:
+                    db.session.add(DiscoursePost(
+                        id=post['id'],
+                        topic_id=topic_id,
+                        post_number=post.get('post_number', 0),
+                        username=post.get('username'),
+                        reply_to_post_number=post.get('reply_to_post_number'),
+                        raw=raw,
+                        created_at=parse_timestamp(post['created_at']),
+                        updated_at=updated_at
+                    ))
+                elif row.raw != raw:
+                    row.raw = raw
+                    row.updated_at = updated_at
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error storing posts of Discourse topic {topic_id}: {e}")
+
+    def _topic_record(self, topic: Dict) -> Dict:
+        """
+        ScrapedContent fields for a topic, built from all of its stored posts.
+        """
+        posts = db.session.execute(
+            db.select(DiscoursePost)
+            .where(DiscoursePost.topic_id == topic['id'])
+            .order_by(DiscoursePost.post_number)
+        ).scalars()
+        content = "\n\n".join(f"{post.username or 'unknown'}: {post.raw.strip()}" for post in posts)
+        return {
+            'url': self.topic_url(topic),
+            'title': (topic.get('title') or topic.get('fancy_title') or '')[:200],
+            'content': content,
+            'content_type': 'discourse',
+            'etag': None,
+            'last_modified': None,
+            'content_hash': content_hash(content)
+        }
+
+    def _link_posts(self, topic_urls: Dict[str, int]):
+        """
+        Point each topic's posts at its ScrapedContent row.
+        """
+        if not topic_urls:
+            return
+        try:
+            rows = db.session.execute(
+                db.select(ScrapedContent.id, ScrapedContent.url).where(ScrapedContent.url.in_(list(topic_urls)))
+            ).all()
+            for content_id, url in rows:
+                db.session.execute(
+                    db.update(DiscoursePost)
+                    .where(DiscoursePost.topic_id == topic_urls[url])
+                    .values(content_id=content_id)
+                )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error linking Discourse posts: {e}")
@@ -0,0 +1,223 @@
+"""
+Compact, memory-mapped document store for the vector index.
+
+File layout (little-endian):
+    magic      8 bytes   b'TDSDOCS1'
+    count      uint64
+    ids        int64[count]       parent ScrapedContent id of each record
+    offsets    uint64[count + 1]  byte offsets of each record in the blob
+    blob       concatenated UTF-8 JSON records
+
+Readers map the file with mmap, so worker processes share the page cache and
+a lookup only decodes the records it returns.
+"""
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from typing import Iterator, List
+import numpy as np
+
+MAGIC = b'TDSDOCS1'
+HEADER = struct.Struct('<8sQ')
+
+
+class DocStoreWriter:
+    """
+    Streams records to a new document store file.
+    The file only appears at `path` once `close()` succeeds.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        self._blob = tempfile.NamedTemporaryFile(dir=directory, prefix='.docs-blob-', delete=False)
+        self._ids: List[int] = []
+        self._offsets: List[int] = [0]
+
+    def add(self, doc: dict):
+        """
+        Append one record.
+        """
+        self.add_raw(doc.get('id', -1), json.dumps(doc, ensure_ascii=False).encode('utf-8'))
+
+    def add_raw(self, doc_id: int, data: bytes):
+        """
+        Append an already encoded record.
+        """
+        self._blob.write(data)
+        self._ids.append(doc_id)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def extend_from(self, store: 'DocStore'):
+        """
+        Copy every record from an existing store without decoding it.
+        """
+        for i in range(len(store)):
+            self.add_raw(int(store.ids[i]), store.raw(i))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def close(self):
+        """
+        Write the header and arrays, then atomically move the file into place.
+        """
+        self._blob.flush()
+        self._blob.seek(0)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.docs-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, len(self._ids)))
+                f.write(np.asarray(self._ids, dtype='<i8').tobytes())
+                f.write(np.asarray(self._offsets, dtype='<u8').tobytes())
+                shutil.copyfileobj(self._blob, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            self._blob.close()
+            os.remove(self._blob.name)
+
+    def abort(self):
+        """
+        Discard everything written so far.
+        """
+        self._blob.close()
+        os.remove(self._blob.name)
+
+
+class DocStore:
+    """
+    Read-only, memory-mapped view of a document store file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER.size:
+            self._file.close()
+            raise ValueError(f"Document store {path} is truncated")
+
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a document store")
+
+        ids_start = HEADER.size
+        offsets_start = ids_start + 8 * count
+        self._blob_start = offsets_start + 8 * (count + 1)
+
+        self.ids = np.frombuffer(self._mmap, dtype='<i8', count=count, offset=ids_start)
+        self._offsets = np.frombuffer(self._mmap, dtype='<u8', count=count + 1, offset=offsets_start)
+        if self._blob_start + int(self._offsets[-1]) > size:
+            self.close()
+            raise ValueError(f"Document store {path} is truncated")
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def raw(self, i: int) -> bytes:
+        """
+        Return the encoded bytes of record i.
+        """
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        start = self._blob_start + int(self._offsets[i])
+        end = self._blob_start + int(self._offsets[i + 1])
+        return self._mmap[start:end]
+
+    def __getitem__(self, i: int) -> dict:
+        return json.loads(self.raw(i))
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(self._count):
+            yield self[i]
+
+    def close(self):
+        """
+        Release the mapping. Arrays obtained from `ids` must not be used afterwards.
+        """
+        self.ids = None
+        self._offsets = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Numpy views still reference the mapping; it is released with them
+            pass
+        self._file.close()
+
+
+def write_doc_store(path: str, documents) -> int:
+    """
+    Write an iterable of records to `path`. Returns the number written.
+    """
+    writer = DocStoreWriter(path)
+    try:
+        for doc in documents:
+            writer.add(doc)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+    return len(writer)
+
+
+class AppendableDocStore:
+    """
+    A memory-mapped base store plus records appended since it was written.
+    """
+
+    def __init__(self, base: DocStore = None):
+        self.base = base
+        self.tail: List[dict] = []
+
+    def __len__(self):
+        return (len(self.base) if self.base is not None else 0) + len(self.tail)
+
+    def __getitem__(self, i: int) -> dict:
+        base_count = len(self.base) if self.base is not None else 0
+        if i < base_count:
+            return self.base[i]
+        return self.tail[i - base_count]
+
+    def append(self, doc: dict):
+        self.tail.append(doc)
+
+    def positions_of(self, content_ids) -> List[int]:
+        """
+        Positions of every record belonging to the given parent content ids.
+        """
+        wanted = set(int(i) for i in content_ids)
+        positions = []
+        base_count = 0
+        if self.base is not None:
+            base_count = len(self.base)
+            matches = np.isin(self.base.ids, np.fromiter(wanted, dtype='<i8', count=len(wanted)))
+            positions.extend(int(i) for i in np.flatnonzero(matches))
+        positions.extend(base_count + i for i, doc in enumerate(self.tail) if doc.get('id') in wanted)
+        return positions
+
+    def write_to(self, writer: DocStoreWriter):
+        """
+        Copy the base records raw and encode the appended ones.
+        """
+        if self.base is not None:
+            writer.extend_from(self.base)
+        for doc in self.tail:
+            writer.add(doc)
+
+    def close(self):
+        if self.base is not None:
+            self.base.close()
@@ -0,0 +1,242 @@
+"""
+Micro-batching of concurrent vector searches.
+
+A query embedding costs one model forward pass whether it is encoded alone
+or with others, and a FAISS search over a matrix of queries scans the index
+once. Under concurrent load, search() therefore hands each query to a
+background thread, which collects the queries that arrive within
+EMBED_BATCH_WINDOW_MS of the first one (or until EMBED_BATCH_MAX are waiting),
+runs them through VectorStore.search_batch, and returns each result to the
+request that asked for it. Queries that arrive while a batch is being
+searched form the next one.
+
+The window is the latency cost of batching, so it is only waited while the
+previous batch held more than one query: a worker serving one request at a
+time searches immediately, as before. Set EMBED_BATCH_WINDOW_MS=0 to bypass
+the batcher entirely.
+
+Run `python embedding_batcher.py` to print throughput and latency with and
+without batching at several concurrency levels.
+"""
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Tuple
+from app import app
+
+logger = logging.getLogger(__name__)
+
+WINDOW_MS = float(os.environ.get('EMBED_BATCH_WINDOW_MS', 2.0))
+MAX_BATCH = int(os.environ.get('EMBED_BATCH_MAX', 32))
+SEARCH_TIMEOUT = 30.0  # Seconds a caller waits for its batch before giving up
+
+
+class EmbeddingBatcher:
+    def __init__(self, store, window_ms: float = WINDOW_MS, max_batch: int = MAX_BATCH):
+        self.store = store
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+        self._concurrent = False  # Whether the last batch had company
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0 and self.max_batch > 1
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so each (gunicorn) worker starts its own
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+            self._thread.start()
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[dict, float]]:
+        """
+        VectorStore.search(query, top_k), batched with concurrent callers.
+        """
+        if not self.enabled:
+            return self.store.search(query, top_k=top_k)
+        self._ensure_started()
+        future = Future()
+        self._queue.put((query, top_k, future))
+        try:
+            return future.result(timeout=SEARCH_TIMEOUT)
+        except FutureTimeoutError:
+            # Still queued: the worker drops it instead of searching for nobody
+            future.cancel()
+            raise
+
+    def _collect(self) -> List[Tuple[str, int, Future]]:
+        batch = [self._queue.get()]
+        window = self.window_ms / 1000 if self._concurrent else 0.0
+        deadline = time.monotonic() + window
+        while len(batch) < self.max_batch:
+            try:
+                # Whatever queued up during the last batch is taken without waiting
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        self._concurrent = len(batch) > 1
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Callers that timed out no longer need an answer
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if batch:
+                self._search(batch)
+
+    def _search(self, batch: List[Tuple[str, int, Future]]):
+        top_k = max(item[1] for item in batch)
+        try:
+            with app.app_context():
+                results = self.store.search_batch([item[0] for item in batch], top_k=top_k)
+        except Exception as e:
+            logger.error(f"Error in batched vector search of {len(batch)} queries: {e}")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, k, future), found in zip(batch, results):
+            future.set_result(found[:k])
+        with self._lock:
+            self.batches += 1
+            self.queries += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'batches': self.batches,
+            'queries': self.queries,
+            'mean_batch_size': self.queries / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch
+        }
+
+
+# Global batcher for the vector store, created on first use
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> EmbeddingBatcher:
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                from vector_store import vector_store
+                _batcher = EmbeddingBatcher(vector_store)
+    return _batcher
+
+
+def _load_test(search, questions: List[str], concurrency: int) -> Dict:
+    """
+    Run every question through `search` from `concurrency` threads.
+    """
+    latencies = []
+    pending = list(questions)
+    pending_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with pending_lock:
+                if not pending:
+                    return
+                question = pending.pop()
+            started = time.perf_counter()
+            search(question)
+            elapsed = (time.perf_counter() - started) * 1000
+            with pending_lock:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'qps': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2],
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput vs latency of batched vector search")
+    parser.add_argument('--queries', type=int, default=400, help="Queries per run")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--window-ms', type=float, default=WINDOW_MS or 2.0)
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--top-k', type=int, default=15)
+    args = parser.parse_args()
+
+    from app import initialize_database
+    from vector_store import vector_store
+
+    initialize_database()
+    with app.app_context():
+        vector_store.ensure_loaded()
+        texts = vector_store.passage_texts()
+    if not texts:
+        print("No passages in the database")
+        return
+
+    def direct(question):
+        with app.app_context():
+            return vector_store.search(question, top_k=args.top_k)
+
+    batcher = EmbeddingBatcher(vector_store, args.window_ms, args.max_batch)
+    modes = (
+        ('direct', direct),
+        ('batched', lambda question: batcher.search(question, top_k=args.top_k))
+    )
+    direct(texts[0][:200])  # Warm up the model before timing anything
+
+    print(f"{len(texts)} passages, {args.queries} queries per run, "
+          f"window {args.window_ms}ms, max batch {args.max_batch}")
+    print(f"{'threads':>8}{'mode':>9}{'qps':>9}{'p50 ms':>9}{'p95 ms':>9}{'batch':>7}")
+    run = 0
+    for concurrency in args.concurrency:
+        for mode, search in modes:
+            run += 1
+            # Distinct questions per run, so the query cache never answers
+            questions = [f"{texts[i % len(texts)][:200]} #{run}-{i}" for i in range(args.queries)]
+            before = batcher.stats()
+            result = _load_test(search, questions, concurrency)
+            after = batcher.stats()
+            batches = after['batches'] - before['batches']
+            mean_batch = (after['queries'] - before['queries']) / batches if batches else 1.0
+            print(f"{concurrency:>8}{mode:>9}{result['qps']:>9.1f}{result['p50_ms']:>9.2f}"
+                  f"{result['p95_ms']:>9.2f}{mean_batch:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Bounded LRU cache of query embeddings.
+
+Students ask the same handful of questions over and over, so caching the
+normalized query vector lets repeated questions skip the transformer forward
+pass entirely. An optional SQLite-backed disk tier keeps entries across
+restarts and is shared by every worker on the host. It holds at most
+`disk_maxsize` entries, dropping the least recently used ones.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+PRUNE_EVERY = 256  # Disk writes between size checks of the disk tier
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical cache key for a query: lowercase with collapsed whitespace.
+    """
+    return _WHITESPACE_RE.sub(' ', query.strip().lower())
+
+
+class QueryEmbeddingCache:
+    def __init__(self, maxsize: int = 1024, disk_path: Optional[str] = None, namespace: str = '',
+                 disk_maxsize: int = 100000):
+        """
+        `namespace` (typically the model name) keeps vectors from different
+        models apart in the shared disk tier.
+        """
+        self.maxsize = maxsize
+        self.namespace = namespace
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()  # Guards the in-memory tier only; disk I/O runs outside it
+        self.disk_path = disk_path
+        self.disk_maxsize = disk_maxsize
+        self._local = threading.local()
+        self._disk_writes = 0
+
+    def _disk_connection(self) -> Optional[sqlite3.Connection]:
+        """
+        The disk tier connection of the calling thread, opened on first use.
+        Each thread (and each process, since SQLite connections must not be
+        used across fork) has its own, so disk lookups run concurrently.
+        """
+        if not self.disk_path:
+            return None
+        if getattr(self._local, 'pid', None) == os.getpid():
+            return self._local.disk
+        self._local.pid = os.getpid()
+        self._local.disk = None
+        try:
+            disk = sqlite3.connect(self.disk_path, isolation_level=None, timeout=1.0)
+            disk.execute("PRAGMA journal_mode=WAL")
+            disk.execute(
+                "CREATE TABLE IF NOT EXISTS query_embedding ("
+                "namespace TEXT NOT NULL, query TEXT NOT NULL, vector BLOB NOT NULL, "
+                "last_used REAL NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (namespace, query))"
+            )
+            columns = [row[1] for row in disk.execute("PRAGMA table_info(query_embedding)")]
+            if 'last_used' not in columns:
+                # Files written before the disk tier was bounded
+                disk.execute("ALTER TABLE query_embedding ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            disk.execute("CREATE INDEX IF NOT EXISTS ix_query_embedding_last_used ON query_embedding (last_used)")
+            self._local.disk = disk
+        except sqlite3.Error as e:
+            logger.error(f"Error opening query embedding cache at {self.disk_path}: {e}")
+        return self._local.disk
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """
+        Return the cached embedding for a query, or None.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        vector = self._disk_get(key)
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self._store(key, vector)
+            self.disk_hits += 1
+            return vector
+
+    def _disk_get(self, key: str) -> Optional[np.ndarray]:
+        disk = self._disk_connection()
+        if disk is None:
+            return None
+        try:
+            row = disk.execute(
+                "SELECT vector FROM query_embedding WHERE namespace = ? AND query = ?",
+                (self.namespace, key)
+            ).fetchone()
+            if row is None:
+                return None
+            disk.execute(
+                "UPDATE query_embedding SET last_used = ? WHERE namespace = ? AND query = ?",
+                (time.time(), self.namespace, key)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Error reading query embedding cache: {e}")
+            return None
+        return np.frombuffer(row[0], dtype='float32')
+
+    def put(self, query: str, vector: np.ndarray):
+        """
+        Cache the embedding for a query.
+        """
+        key = normalize_query(query)
+        vector = np.array(vector, dtype='float32').reshape(-1)
+        vector.flags.writeable = False
+        with self._lock:
+            self._store(key, vector)
+            self._disk_writes += 1
+            prune = self._disk_writes % PRUNE_EVERY == 0
+
+        disk = self._disk_connection()
+        if disk is None:
+            return
+        try:
+            disk.execute(
+                "INSERT OR REPLACE INTO query_embedding (namespace, query, vector, last_used) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, vector.tobytes(), time.time())
+            )
+            if prune:
+                self._prune_disk(disk)
+        except sqlite3.Error as e:
+            logger.error(f"Error writing query embedding cache: {e}")
+
+    def _prune_disk(self, disk: sqlite3.Connection):
+        """
+        Drop the least recently used disk entries beyond disk_maxsize.
+        """
+        removed = disk.execute(
+            "DELETE FROM query_embedding WHERE rowid IN ("
+            "SELECT rowid FROM query_embedding ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.disk_maxsize,)
+        ).rowcount
+        if removed:
+            logger.info(f"Evicted {removed} entries from the query embedding disk cache")
+
+    def _store(self, key: str, vector: np.ndarray):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """
+        Hit/miss counters for monitoring.
+        """
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0
+            }
@@ -0,0 +1,289 @@
+"""
+Pluggable sentence encoders for the vector store.
+
+Backends (EMBEDDING_BACKEND):
+    sentence-transformers   the reference PyTorch model (default)
+    onnx                    the same weights exported to ONNX, run with ONNX Runtime
+    onnx-int8               the ONNX model with dynamic int8 weight quantization
+
+The ONNX backends reproduce the reference pipeline (tokenize, mean-pool the
+last hidden state over the attention mask, L2-normalize), so their vectors
+can be searched against an index built with the reference model. Exported
+models are cached in EMBEDDING_MODEL_DIR. Check agreement and speed with:
+
+    python encoders.py --backends sentence-transformers onnx onnx-int8
+"""
+import abc
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('sentence-transformers', 'onnx', 'onnx-int8')
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+BACKEND = os.environ.get('EMBEDDING_BACKEND', 'sentence-transformers').lower()
+MODEL_DIR = os.environ.get('EMBEDDING_MODEL_DIR', 'models')
+MAX_SEQ_LENGTH = 256  # Same truncation as the reference model
+MIN_AGREEMENT = 0.99  # Lowest acceptable mean cosine with the reference embeddings
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+class Encoder(abc.ABC):
+    """
+    Turns texts into float32 embeddings of a fixed dimension.
+    """
+    name = 'encoder'
+    dimension = 0
+
+    @abc.abstractmethod
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        ...
+
+
+class SentenceTransformerEncoder(Encoder):
+    name = 'sentence-transformers'
+
+    def __init__(self, model_name: str = DEFAULT_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        embeddings = self.model.encode(texts, batch_size=batch_size, convert_to_tensor=False)
+        return np.asarray(embeddings, dtype='float32')
+
+    # Multi-process encoding for large rebuilds
+    def start_multi_process_pool(self, devices: List[str]):
+        return self.model.start_multi_process_pool(devices)
+
+    def encode_multi_process(self, texts: List[str], pool, batch_size: int = 32) -> np.ndarray:
+        embeddings = self.model.encode_multi_process(texts, pool, batch_size=batch_size)
+        return np.asarray(embeddings, dtype='float32')
+
+    def stop_multi_process_pool(self, pool):
+        self.model.stop_multi_process_pool(pool)
+
+
+def _hub_name(model_name: str) -> str:
+    return model_name if '/' in model_name else f'sentence-transformers/{model_name}'
+
+
+def export_onnx(model_name: str, path: str):
+    """
+    Export the transformer behind a sentence-transformers model to ONNX.
+    Needs torch and transformers, which the reference backend already uses.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    hub_name = _hub_name(model_name)
+    tokenizer = AutoTokenizer.from_pretrained(hub_name)
+    model = AutoModel.from_pretrained(hub_name)
+    model.eval()
+
+    sample = tokenizer(["export sample"], return_tensors='pt')
+    input_names = list(sample.keys())
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[name] for name in input_names), tmp_path,
+            input_names=input_names, output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes, opset_version=14
+        )
+    os.replace(tmp_path, path)
+    logger.info(f"Exported {hub_name} to {path}")
+
+
+def quantize_onnx(source: str, path: str):
+    """
+    Quantize an ONNX model's weights to int8 (activations stay float).
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp_path = f"{path}.tmp"
+    quantize_dynamic(source, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, path)
+    logger.info(f"Quantized {source} to int8 at {path}")
+
+
+class OnnxEncoder(Encoder):
+    """
+    Runs the exported transformer with ONNX Runtime and applies the
+    reference model's mean pooling and normalization.
+    """
+    name = 'onnx'
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, model_dir: str = MODEL_DIR):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(_hub_name(model_name))
+        path = self._model_path(model_name, model_dir)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.dimension = self.encode(["dimension probe"]).shape[1]
+
+    def _base_path(self, model_name: str, model_dir: str) -> str:
+        path = os.path.join(model_dir, f"{model_name.replace('/', '__')}.onnx")
+        if not os.path.exists(path):
+            export_onnx(model_name, path)
+        return path
+
+    def _model_path(self, model_name: str, model_dir: str) -> str:
+        return self._base_path(model_name, model_dir)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True,
+                max_length=MAX_SEQ_LENGTH, return_tensors='np'
+            )
+            inputs = {name: value.astype('int64') for name, value in tokens.items() if name in self.input_names}
+            hidden = self.session.run(None, inputs)[0]
+
+            # Mean pooling over real (non-padding) tokens
+            mask = tokens['attention_mask'][..., None].astype('float32')
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            batches.append(_normalize(pooled).astype('float32'))
+
+        if not batches:
+            return np.zeros((0, self.dimension), dtype='float32')
+        return np.vstack(batches)
+
+
+class QuantizedOnnxEncoder(OnnxEncoder):
+    name = 'onnx-int8'
+
+    def _model_path(self, model_name: str, model_dir: str) -> str:
+        path = os.path.join(model_dir, f"{model_name.replace('/', '__')}.int8.onnx")
+        if not os.path.exists(path):
+            quantize_onnx(self._base_path(model_name, model_dir), path)
+        return path
+
+
+def get_encoder(backend: Optional[str] = None, model_name: str = DEFAULT_MODEL) -> Encoder:
+    """
+    Create the encoder for a backend (EMBEDDING_BACKEND by default).
+    """
+    backend = (backend or BACKEND).lower()
+    if backend == 'sentence-transformers':
+        return SentenceTransformerEncoder(model_name)
+    if backend == 'onnx':
+        return OnnxEncoder(model_name)
+    if backend == 'onnx-int8':
+        return QuantizedOnnxEncoder(model_name)
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+
+
+def consistency_check(encoder: Encoder, reference: Encoder, texts: List[str]) -> Dict:
+    """
+    Cosine similarity between an encoder's and the reference's embeddings
+    of the same texts.
+    """
+    ours = _normalize(encoder.encode(texts))
+    theirs = _normalize(reference.encode(texts))
+    cosines = (ours * theirs).sum(axis=1)
+    return {
+        'mean_cosine': float(cosines.mean()),
+        'min_cosine': float(cosines.min()),
+        'compatible': bool(cosines.mean() >= MIN_AGREEMENT)
+    }
+
+
+def benchmark(backend: str, texts: List[str], queries: int = 100, batch_size: int = 64,
+              model_name: str = DEFAULT_MODEL) -> Dict:
+    """
+    Load time, single-query latency and batch throughput of one backend.
+    """
+    start = time.perf_counter()
+    encoder = get_encoder(backend, model_name)
+    load_s = time.perf_counter() - start
+
+    encoder.encode(texts[:1])  # Warm-up
+    latencies = []
+    for i in range(queries):
+        start = time.perf_counter()
+        encoder.encode([texts[i % len(texts)]])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    encoder.encode(texts, batch_size=batch_size)
+    batch_s = time.perf_counter() - start
+
+    return {
+        'backend': backend,
+        'encoder': encoder,
+        'load_s': load_s,
+        'query_ms_p50': float(np.percentile(latencies, 50)),
+        'query_ms_p95': float(np.percentile(latencies, 95)),
+        'docs_per_sec': len(texts) / batch_s
+    }
+
+
+def _sample_texts(count: int) -> List[str]:
+    try:
+        from app import app, db, initialize_database
+        from models import ContentPassage
+        initialize_database()
+        with app.app_context():
+            rows = db.session.execute(
+                db.select(ContentPassage.title, ContentPassage.text).order_by(ContentPassage.id).limit(count)
+            ).all()
+        if rows:
+            return [f"{title}\n{text}" for title, text in rows]
+    except Exception as e:
+        logger.warning(f"Could not read passages from the database: {e}")
+    topics = ['pandas groupby', 'docker volumes', 'git rebase', 'linear regression', 'REST APIs',
+              'SQL joins', 'JSON parsing', 'web scraping', 'matplotlib plots', 'virtual environments']
+    return [f"How do I use {topics[i % len(topics)]} in assignment {i}?" for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends against the reference model")
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--texts', type=int, default=512, help="Number of texts for throughput and agreement")
+    parser.add_argument('--queries', type=int, default=100, help="Single-query encodes to time")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--json', action='store_true', help="Print machine-readable output")
+    args = parser.parse_args()
+
+    texts = _sample_texts(args.texts)
+    results = [benchmark(backend, texts, args.queries, args.batch_size, args.model) for backend in args.backends]
+
+    reference = next((r['encoder'] for r in results if r['backend'] == 'sentence-transformers'), None)
+    if reference is None:
+        reference = get_encoder('sentence-transformers', args.model)
+    for result in results:
+        result.update(consistency_check(result.pop('encoder'), reference, texts))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{len(texts)} texts, {args.queries} single queries, batch size {args.batch_size}")
+    print(f"{'backend':<24}{'load s':>8}{'p50 ms':>9}{'p95 ms':>9}{'docs/s':>9}{'cosine':>9}{'min':>8}")
+    for row in results:
+        print(f"{row['backend']:<24}{row['load_s']:>8.2f}{row['query_ms_p50']:>9.2f}{row['query_ms_p95']:>9.2f}"
+              f"{row['docs_per_sec']:>9.0f}{row['mean_cosine']:>9.4f}{row['min_cosine']:>8.4f}")
+
+
+if __name__ == '__main__':
+    main()
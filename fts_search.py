@@ -0,0 +1,142 @@
+"""
+SQLite FTS5 search backend for content passages.
+
+An external-content FTS5 table mirrors ContentPassage.title/text and is kept
+in sync by triggers, so ranking (bm25()) and top-k selection run inside SQLite
+and only the winning rows are returned to Python.
+"""
+import logging
+from typing import Dict, List
+from sqlalchemy import text
+from app import db
+from inverted_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'content_passage_fts'
+TITLE_WEIGHT = 2.0
+TEXT_WEIGHT = 1.0
+
+_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, text, content='content_passage', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS content_passage_fts_ai AFTER INSERT ON content_passage BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS content_passage_fts_ad AFTER DELETE ON content_passage BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS content_passage_fts_au AFTER UPDATE OF title, text ON content_passage BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, title, text) VALUES (new.id, new.title, new.text);
+    END""",
+]
+
+# Document-level FTS objects from before passages were introduced
+_LEGACY_DDL = [
+    "DROP TRIGGER IF EXISTS scraped_content_fts_ai",
+    "DROP TRIGGER IF EXISTS scraped_content_fts_ad",
+    "DROP TRIGGER IF EXISTS scraped_content_fts_au",
+    "DROP TABLE IF EXISTS scraped_content_fts",
+]
+
+_available = None
+
+
+def fts_available() -> bool:
+    """
+    Check whether the database is SQLite with the FTS5 table in place.
+    """
+    global _available
+    if _available is None:
+        try:
+            if db.engine.dialect.name != 'sqlite':
+                _available = False
+            else:
+                found = db.session.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': FTS_TABLE}
+                ).first()
+                _available = found is not None
+        except Exception as e:
+            logger.error(f"Error checking FTS5 availability: {e}")
+            _available = False
+    return _available
+
+
+def ensure_fts_table():
+    """
+    Create the FTS5 table and sync triggers, populating it on first creation.
+    Call after the passages have been built so the initial rebuild sees them.
+    """
+    global _available
+    if db.engine.dialect.name != 'sqlite':
+        _available = False
+        return
+
+    try:
+        existed = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE}
+        ).first() is not None
+
+        for statement in _LEGACY_DDL + _FTS_DDL:
+            db.session.execute(text(statement))
+
+        if not existed:
+            db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+            logger.info("Created FTS5 index for content passages")
+
+        db.session.commit()
+        _available = True
+    except Exception as e:
+        # Raised when SQLite was compiled without FTS5
+        db.session.rollback()
+        logger.warning(f"FTS5 search unavailable: {e}")
+        _available = False
+
+
+def build_match_query(question: str) -> str:
+    """
+    Turn free text into an FTS5 MATCH expression that ORs the quoted terms.
+    """
+    terms = dict.fromkeys(tokenize(question))
+    return ' OR '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def search(question: str, top_k: int = 5) -> List[Dict]:
+    """
+    Rank passages with bm25() inside SQLite and return the top-k rows.
+    """
+    match = build_match_query(question)
+    if not match:
+        return []
+
+    rows = db.session.execute(
+        text(f"""
+            SELECT p.id AS passage_id, p.content_id, p.title, p.text, c.url,
+                   -bm25({FTS_TABLE}, :title_weight, :text_weight) AS score
+            FROM {FTS_TABLE}
+            JOIN content_passage AS p ON p.id = {FTS_TABLE}.rowid
+            JOIN scraped_content AS c ON c.id = p.content_id
+            WHERE {FTS_TABLE} MATCH :match
+            ORDER BY bm25({FTS_TABLE}, :title_weight, :text_weight)
+            LIMIT :limit
+        """),
+        {
+            'match': match,
+            'title_weight': TITLE_WEIGHT,
+            'text_weight': TEXT_WEIGHT,
+            'limit': top_k,
+        }
+    ).all()
+
+    return [{
+        'id': row.content_id,
+        'passage_id': row.passage_id,
+        'title': row.title,
+        'url': row.url,
+        'content': row.text,
+        'score': row.score
+    } for row in rows]
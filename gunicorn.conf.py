@@ -0,0 +1,59 @@
+"""
+Gunicorn settings for serving many workers from one copy of the model and index.
+
+    gunicorn --bind 0.0.0.0:5000 --workers 4 main:app
+
+Gunicorn reads this file from the working directory automatically. The app
+is imported in the master (preload_app), which then loads the database,
+embedding model and vector index before forking, so workers share those
+pages copy-on-write instead of each loading its own copy. The document store
+is memory-mapped already; set VECTOR_INDEX_MMAP=1 to map the index file too,
+which keeps it shared after workers hot-swap to a newly published generation
+(checked every VECTOR_RELOAD_INTERVAL seconds).
+
+Set GUNICORN_PRELOAD=0, or pass --reload, to load the app in each worker as before.
+"""
+import gc
+import os
+import sys
+
+preload_app = (os.environ.get('GUNICORN_PRELOAD', '1').lower() in ('1', 'true', 'yes')
+               and '--reload' not in sys.argv)
+
+# Math library threads per worker; workers already run in parallel
+WORKER_THREADS = int(os.environ.get('GUNICORN_WORKER_MATH_THREADS', 1))
+
+
+def when_ready(server):
+    """
+    Master, before the first fork: load everything workers will share.
+    """
+    if not preload_app:
+        return
+    import startup
+
+    startup.start_warmup().join()
+    status = startup.status()
+    if status['errors']:
+        server.log.warning(f"Warm-up errors, workers will retry on first use: {status['errors']}")
+    # Keep the collector from touching (and so copying) the preloaded objects
+    gc.freeze()
+    server.log.info(f"Preloaded app state {status['uptime']:.1f}s after import")
+
+
+def post_fork(server, worker):
+    """
+    Worker, just after fork: drop state that must not be shared with the master.
+    """
+    if not preload_app:
+        return
+    from app import app, db
+
+    # Pooled connections were opened by the master
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+    import faiss
+    faiss.omp_set_num_threads(WORKER_THREADS)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(WORKER_THREADS)
@@ -0,0 +1,157 @@
+"""
+Hybrid retrieval: lexical (FTS5/BM25) and vector search fused into one ranking.
+
+Both retrievers run in parallel for RETRIEVAL_TOP_K * CANDIDATE_MULTIPLIER
+candidates each, and their lists are merged by passage with either:
+
+    rrf        reciprocal rank fusion, sum of 1 / (RRF_K + rank) (default)
+    weighted   HYBRID_VECTOR_WEIGHT * cosine + (1 - weight) * BM25 / best BM25
+
+Keyword matches catch exact names (model ids, assignment numbers) that
+embeddings blur, and embeddings catch paraphrases with no shared terms, so the
+fused top-k holds more relevant passages than either list alone. A retriever
+that fails or takes longer than RETRIEVER_TIMEOUT is skipped for that query.
+Until the embedding model and vector index are loaded (in the background,
+started by the first search) questions are answered from lexical results.
+"""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple
+from app import app
+import startup
+
+logger = logging.getLogger(__name__)
+
+# Passages returned per question; everything else is derived from it
+TOP_K = int(os.environ.get('RETRIEVAL_TOP_K', 5))
+CANDIDATE_MULTIPLIER = 3  # Candidates each retriever contributes per returned passage
+
+FUSION = os.environ.get('HYBRID_FUSION', 'rrf').lower()
+RRF_K = 60  # Damps the weight of top ranks; 60 is the value from the RRF paper
+VECTOR_WEIGHT = float(os.environ.get('HYBRID_VECTOR_WEIGHT', 0.5))
+MIN_VECTOR_SCORE = float(os.environ.get('HYBRID_MIN_VECTOR_SCORE', 0.2))  # Cosine floor for vector candidates
+RETRIEVER_TIMEOUT = float(os.environ.get('RETRIEVER_TIMEOUT', 5.0))
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='retriever')
+_vector_unavailable = False
+
+
+def _in_app_context(fn, *args):
+    with app.app_context():
+        return fn(*args)
+
+
+def _lexical(question: str, limit: int) -> List[Dict]:
+    from ai_assistant_simple import lexical_search
+    return lexical_search(question, limit)
+
+
+def _vector_ready() -> bool:
+    """
+    Whether vector search can answer without loading anything first.
+    """
+    global _vector_unavailable
+    if _vector_unavailable:
+        return False
+    try:
+        from vector_store import vector_store
+    except ImportError as e:
+        _vector_unavailable = True
+        logger.warning(f"Vector search unavailable, using lexical search only: {e}")
+        return False
+    if vector_store.index is None:
+        startup.start_warmup()
+        return False
+    return True
+
+
+def _vector(question: str, limit: int) -> List[Dict]:
+    from embedding_batcher import get_batcher
+    results = []
+    # Batched with the vector searches of concurrent questions
+    for doc, score in get_batcher().search(question, top_k=limit):
+        if score >= MIN_VECTOR_SCORE:
+            results.append(dict(doc, score=score))
+    return results
+
+
+def _timed(fn, *args) -> Tuple[List[Dict], float]:
+    started = time.perf_counter()
+    results = _in_app_context(fn, *args)
+    return results, (time.perf_counter() - started) * 1000
+
+
+def _collect(name: str, future, deadline: float, timings: Dict[str, float]) -> List[Dict]:
+    try:
+        results, elapsed_ms = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+        timings[f'{name}_ms'] = elapsed_ms
+        return results
+    except FutureTimeoutError:
+        logger.warning(f"{name} search timed out after {RETRIEVER_TIMEOUT}s, using the other retriever only")
+    except Exception as e:
+        logger.error(f"Error in {name} search: {e}")
+    timings[f'{name}_ms'] = None
+    return []
+
+
+def fuse(lexical: List[Dict], vector: List[Dict], top_k: int, method: str = FUSION) -> List[Dict]:
+    """
+    Merge two best-first passage lists into one, keyed by passage id.
+    Each result keeps both retrievers' ranks and scores (None if it was not
+    retrieved by one of them) next to the fused 'score'.
+    """
+    merged: Dict[int, Dict] = {}
+    for source, results in (('lexical', lexical), ('vector', vector)):
+        for rank, passage in enumerate(results, 1):
+            entry = merged.get(passage['passage_id'])
+            if entry is None:
+                entry = {key: passage[key] for key in ('id', 'passage_id', 'title', 'url', 'content')}
+                entry.update(lexical_rank=None, lexical_score=None, vector_rank=None, vector_score=None)
+                merged[passage['passage_id']] = entry
+            entry[f'{source}_rank'] = rank
+            entry[f'{source}_score'] = passage['score']
+
+    best_lexical = max((p['score'] for p in lexical), default=0.0) or 1.0
+    for entry in merged.values():
+        if method == 'weighted':
+            entry['score'] = (VECTOR_WEIGHT * max(entry['vector_score'] or 0.0, 0.0)
+                              + (1 - VECTOR_WEIGHT) * (entry['lexical_score'] or 0.0) / best_lexical)
+        else:
+            entry['score'] = sum(1.0 / (RRF_K + entry[f'{source}_rank'])
+                                 for source in ('lexical', 'vector') if entry[f'{source}_rank'])
+
+    return sorted(merged.values(), key=lambda e: e['score'], reverse=True)[:top_k]
+
+
+def search(question: str, top_k: Optional[int] = None) -> Tuple[List[Dict], Dict[str, float]]:
+    """
+    The top_k (RETRIEVAL_TOP_K by default) passages for a question, best
+    first, and the time in milliseconds spent in each stage. A stage
+    timing of None means that retriever was skipped, failed or timed out.
+    """
+    top_k = top_k or TOP_K
+    limit = top_k * CANDIDATE_MULTIPLIER
+    started = time.perf_counter()
+
+    lexical_future = _executor.submit(_timed, _lexical, question, limit)
+    vector_future = _executor.submit(_timed, _vector, question, limit) if _vector_ready() else None
+    deadline = started + RETRIEVER_TIMEOUT
+    timings: Dict[str, float] = {}
+    lexical = _collect('lexical', lexical_future, deadline, timings)
+    if vector_future is not None:
+        vector = _collect('vector', vector_future, deadline, timings)
+    else:
+        vector = []
+        timings['vector_ms'] = None
+
+    fusion_started = time.perf_counter()
+    results = fuse(lexical, vector, top_k)
+    timings['fusion_ms'] = (time.perf_counter() - fusion_started) * 1000
+    timings['total_ms'] = (time.perf_counter() - started) * 1000
+
+    logger.debug(f"Hybrid search: {len(lexical)} lexical + {len(vector)} vector candidates -> "
+                 f"{len(results)} passages, " + ', '.join(
+                     f"{stage} {ms:.1f}ms" for stage, ms in timings.items() if ms is not None))
+    return results, timings
@@ -0,0 +1,234 @@
+"""
+Preparation of image attachments for the vision model.
+
+prepare_image() turns the request's base64 string into a PreparedImage:
+
+    1. the encoded length is checked against IMAGE_MAX_BYTES before decoding;
+    2. the string is decoded once, and the real format is sniffed from its
+       magic bytes (PNG, JPEG, GIF or WebP, the formats the API accepts);
+    3. with Pillow installed, the pixel count is checked from the header
+       before the image is decoded, and images larger than the model's
+       effective resolution are downscaled and re-encoded as JPEG;
+    4. results are cached by the SHA-256 of the decoded bytes, up to
+       IMAGE_CACHE_BYTES in total, so a screenshot attached again (or
+       retried) is not processed twice.
+
+GPT-4o scales images to fit 2048x2048 and then to 768 pixels on the short
+side ('high' detail), or to 512x512 ('low'), so pixels beyond that only cost
+upload time and request size.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+except ImportError:  # Optional; images are then sent as uploaded
+    Image = None
+    logger.warning("Pillow is not installed: image attachments will not be size-checked or downscaled")
+
+MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 40_000_000))
+DETAIL = os.environ.get('IMAGE_DETAIL', 'auto').lower()  # 'low', 'high' or 'auto'
+JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', 85))
+CACHE_BYTES = int(os.environ.get('IMAGE_CACHE_BYTES', 64 * 1024 * 1024))
+
+# Effective resolution of the vision model: (long side, short side)
+HIGH_DETAIL_SIZE = (2048, 768)
+LOW_DETAIL_SIZE = (512, 512)
+
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+class ImageError(ValueError):
+    """
+    The attachment cannot be used. `status` is the HTTP status to answer with.
+    """
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class PreparedImage:
+    """
+    A validated image ready to be sent to the model.
+    """
+    __slots__ = ('data', 'mime', 'width', 'height', 'original_size', 'digest', '_data_url')
+
+    def __init__(self, data: bytes, mime: str, width: Optional[int], height: Optional[int],
+                 original_size: int, digest: str):
+        self.data = data
+        self.mime = mime
+        self.width = width
+        self.height = height
+        self.original_size = original_size
+        self.digest = digest
+        self._data_url = None
+
+    @property
+    def cost(self) -> int:
+        """
+        Bytes held once the data URL is built: the payload plus its base64.
+        """
+        return len(self.data) + (len(self.data) + 2) // 3 * 4
+
+    @property
+    def data_url(self) -> str:
+        if self._data_url is None:
+            self._data_url = f"data:{self.mime};base64,{base64.b64encode(self.data).decode('ascii')}"
+        return self._data_url
+
+    def content_part(self) -> dict:
+        """
+        The chat message content part for this image.
+        """
+        return {
+            "type": "image_url",
+            "image_url": {"url": self.data_url, "detail": DETAIL}
+        }
+
+
+_cache: 'OrderedDict[str, PreparedImage]' = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def sniff_mime(data: bytes) -> Optional[str]:
+    """
+    The MIME type of an image from its magic bytes, or None if unsupported.
+    """
+    for signature, mime in _SIGNATURES:
+        if data.startswith(signature):
+            return mime
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def _target_size(width: int, height: int) -> Tuple[int, int]:
+    """
+    The largest size within the model's effective resolution, keeping the
+    aspect ratio and never upscaling.
+    """
+    long_side, short_side = LOW_DETAIL_SIZE if DETAIL == 'low' else HIGH_DETAIL_SIZE
+    scale = min(1.0, long_side / max(width, height), short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _downscale(data: bytes, mime: str) -> Tuple[bytes, str, Optional[int], Optional[int]]:
+    """
+    Shrink an image to the model's effective resolution with Pillow, or
+    return it unchanged if it is already small enough or Pillow is missing.
+    """
+    if Image is None:
+        return data, mime, None, None
+    try:
+        image = Image.open(io.BytesIO(data))  # Reads the header only
+    except Exception:
+        raise ImageError("Invalid image data")
+
+    width, height = image.size
+    if width * height > MAX_PIXELS:
+        raise ImageError(f"Image is too large ({width}x{height} pixels)", 413)
+    if getattr(image, 'is_animated', False):
+        raise ImageError("Animated images are not supported")
+
+    size = _target_size(width, height)
+    if size == (width, height):
+        return data, mime, width, height
+
+    try:
+        if mime == 'image/jpeg':
+            image.draft('RGB', size)  # Lets the JPEG decoder skip most of the work
+        if image.mode in ('P', 'PA', 'LA'):
+            image = image.convert('RGBA')
+        if image.mode == 'RGBA':
+            # JPEG has no alpha; flatten onto white like a viewer would show it
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image = image.resize(size, Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        raise ImageError(f"Invalid image data: {e}")
+
+    resized = output.getvalue()
+    if len(resized) >= len(data):
+        return data, mime, width, height  # Small originals can beat the re-encode
+    return resized, 'image/jpeg', size[0], size[1]
+
+
+def prepare_image(image: Union[str, PreparedImage]) -> PreparedImage:
+    """
+    Validate, decode and downscale a base64 image (a data: URL is accepted
+    too). Raises ImageError if it is invalid, too large or of an
+    unsupported type.
+    """
+    if isinstance(image, PreparedImage):
+        return image
+    if not isinstance(image, str):
+        raise ImageError("Invalid base64 image data")
+
+    if image.startswith('data:'):
+        image = image.partition(',')[2]
+    # Base64 takes 4 characters per 3 bytes (plus a line break every 76 in
+    # MIME-style input): reject oversized images before decoding anything
+    max_encoded = (MAX_BYTES + 2) // 3 * 4
+    if len(image) > max_encoded + max_encoded // 76 * 2:
+        raise ImageError(f"Image is larger than the {MAX_BYTES} byte limit", 413)
+
+    try:
+        data = base64.b64decode(image)
+    except (binascii.Error, ValueError):
+        raise ImageError("Invalid base64 image data")
+    if len(data) > MAX_BYTES:
+        raise ImageError(f"Image is larger than the {MAX_BYTES} byte limit", 413)
+
+    mime = sniff_mime(data)
+    if mime is None:
+        raise ImageError("Unsupported image type; use PNG, JPEG, GIF or WebP")
+
+    digest = hashlib.sha256(data).hexdigest()
+    with _cache_lock:
+        prepared = _cache.get(digest)
+        if prepared is not None:
+            _cache.move_to_end(digest)
+            return prepared
+
+    processed, mime, width, height = _downscale(data, mime)
+    prepared = PreparedImage(processed, mime, width, height, len(data), digest)
+    if len(processed) < len(data):
+        logger.info(f"Downscaled {len(data)} byte image to {width}x{height} ({len(processed)} bytes)")
+
+    _cache_store(prepared)
+    return prepared
+
+
+def _cache_store(prepared: PreparedImage):
+    global _cache_bytes
+    if prepared.cost > CACHE_BYTES:
+        return
+    with _cache_lock:
+        if prepared.digest in _cache:
+            return  # A concurrent request prepared it too
+        _cache[prepared.digest] = prepared
+        _cache_bytes += prepared.cost
+        while _cache_bytes > CACHE_BYTES:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= evicted.cost
@@ -0,0 +1,139 @@
+"""
+Persistent BM25 inverted index over content passages.
+
+Postings live in the database next to the passages they describe and are
+written by the chunker whenever a ScrapedContent row changes, so a query only
+reads the postings for its own terms instead of scanning every document.
+"""
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+from sqlalchemy import delete, insert, select, func
+from app import db
+from models import ContentPassage, IndexedPassage, PassagePosting
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+TITLE_WEIGHT = 2  # Title tokens count twice, matching the old keyword scorer
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*")
+MAX_TERM_LENGTH = 100
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase index terms.
+    """
+    if not text:
+        return []
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) <= MAX_TERM_LENGTH]
+
+
+def term_frequencies(title: str, text: str) -> Counter:
+    """
+    Count weighted term frequencies for a passage.
+    """
+    counts = Counter(tokenize(text))
+    for term in tokenize(title):
+        counts[term] += TITLE_WEIGHT
+    return counts
+
+
+def index_passage(connection, passage_id: int, title: str, text: str):
+    """
+    Write (or rewrite) the postings for a single passage.
+    """
+    remove_passages(connection, [passage_id])
+
+    counts = term_frequencies(title, text)
+    if not counts:
+        return
+
+    connection.execute(
+        insert(IndexedPassage.__table__),
+        [{'passage_id': passage_id, 'length': sum(counts.values())}]
+    )
+    connection.execute(
+        insert(PassagePosting.__table__),
+        [{'term': term, 'passage_id': passage_id, 'tf': tf} for term, tf in counts.items()]
+    )
+
+
+def remove_passages(connection, passage_ids: List[int]):
+    """
+    Drop all postings for the given passages.
+    """
+    if not passage_ids:
+        return
+    connection.execute(delete(PassagePosting.__table__).where(PassagePosting.passage_id.in_(passage_ids)))
+    connection.execute(delete(IndexedPassage.__table__).where(IndexedPassage.passage_id.in_(passage_ids)))
+
+
+def build_index(rebuild: bool = False) -> int:
+    """
+    Index every passage that has no postings yet.
+    Returns the number of passages indexed.
+    """
+    if rebuild:
+        db.session.execute(delete(PassagePosting.__table__))
+        db.session.execute(delete(IndexedPassage.__table__))
+
+    missing = (
+        select(ContentPassage.id, ContentPassage.title, ContentPassage.text)
+        .outerjoin(IndexedPassage, IndexedPassage.passage_id == ContentPassage.id)
+        .where(IndexedPassage.passage_id.is_(None))
+    )
+
+    connection = db.session.connection()
+    indexed = 0
+    for row in db.session.execute(missing).all():
+        index_passage(connection, row.id, row.title, row.text)
+        indexed += 1
+
+    db.session.commit()
+    if indexed:
+        logger.info(f"Indexed {indexed} passages into the inverted index")
+    return indexed
+
+
+def search(query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+    """
+    Score passages against the query with BM25.
+    Returns (passage_id, score) pairs, best first.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+
+    passage_count, total_length = db.session.execute(
+        select(func.count(IndexedPassage.passage_id), func.coalesce(func.sum(IndexedPassage.length), 0))
+    ).one()
+    if not passage_count:
+        return []
+    avg_length = total_length / passage_count
+
+    postings = db.session.execute(
+        select(PassagePosting.term, PassagePosting.passage_id, PassagePosting.tf, IndexedPassage.length)
+        .join(IndexedPassage, IndexedPassage.passage_id == PassagePosting.passage_id)
+        .where(PassagePosting.term.in_(terms))
+    ).all()
+
+    by_term: Dict[str, list] = {}
+    for posting in postings:
+        by_term.setdefault(posting.term, []).append(posting)
+
+    scores: Dict[int, float] = {}
+    for term, term_postings in by_term.items():
+        df = len(term_postings)
+        idf = math.log(1 + (passage_count - df + 0.5) / (df + 0.5))
+        for posting in term_postings:
+            norm = K1 * (1 - B + B * posting.length / avg_length)
+            scores[posting.passage_id] = scores.get(posting.passage_id, 0.0) + idf * posting.tf * (K1 + 1) / (posting.tf + norm)
+
+    ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    return ranked[:top_k]
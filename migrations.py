@@ -0,0 +1,47 @@
+"""
+Minimal in-place schema upgrades.
+
+db.create_all() creates missing tables but never changes existing ones, so
+databases created before a column or index was added to a model are brought
+up to date here: missing nullable columns are added with ALTER TABLE and
+missing indexes are created. Anything more involved needs a real migration.
+"""
+import logging
+from sqlalchemy import inspect, text
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+def _add_missing_columns(connection, table) -> int:
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    added = 0
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        if not column.nullable:
+            logger.warning(f"Cannot add required column {table.name}.{column.name} in place")
+            continue
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        logger.info(f"Added column {table.name}.{column.name}")
+        added += 1
+    return added
+
+
+def upgrade_schema():
+    """
+    Add columns and indexes that the models define but the database lacks.
+    Safe to run on every start.
+    """
+    try:
+        with db.engine.begin() as connection:
+            tables = set(inspect(connection).get_table_names())
+            for table in db.metadata.sorted_tables:
+                if table.name not in tables:
+                    continue
+                _add_missing_columns(connection, table)
+                for index in table.indexes:
+                    index.create(connection, checkfirst=True)
+    except Exception as e:
+        logger.error(f"Error upgrading database schema: {e}")
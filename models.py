@@ -4,12 +4,15 @@ from datetime import datetime
 
 class ScrapedContent(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    url = db.Column(db.String(500), nullable=False)
+    url = db.Column(db.String(500), nullable=False, index=True)
     title = db.Column(db.String(200))
     content = db.Column(db.Text, nullable=False)
     content_type = db.Column(db.String(50), nullable=False)  # 'course' or 'discourse'
     scraped_at = db.Column(db.DateTime, default=datetime.utcnow)
     embedding_id = db.Column(db.Integer)  # Reference to vector store index
+    etag = db.Column(db.String(200))  # Validators from the last fetch, for conditional GETs
+    last_modified = db.Column(db.String(100))
+    content_hash = db.Column(db.String(64))  # SHA-256 of the extracted content
 
     def __repr__(self):
         return f'<ScrapedContent {self.title}>'
@@ -26,3 +29,102 @@ class QuestionAnswer(db.Model):
 
     def __repr__(self):
         return f'<QuestionAnswer {self.id}>'
+
+
+class CachedAnswer(db.Model):
+    """
+    A reusable answer, cleared whenever the scraped content changes.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    question_hash = db.Column(db.String(64), nullable=False, unique=True)  # SHA-256 of the normalized question
+    question = db.Column(db.Text, nullable=False)
+    result = db.Column(db.Text, nullable=False)  # JSON of the answer_question result
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CachedAnswer {self.id}>'
+
+
+class ContentPassage(db.Model):
+    """
+    A bounded-size chunk of a ScrapedContent row, the unit of retrieval.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    content_id = db.Column(db.Integer, db.ForeignKey('scraped_content.id', ondelete='CASCADE'),
+                           nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)  # Chunk number within the parent
+    start_offset = db.Column(db.Integer, nullable=False)  # Character span in the parent content
+    end_offset = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(200))  # Copied from the parent for indexing
+    text = db.Column(db.Text, nullable=False)
+
+    def __repr__(self):
+        return f'<ContentPassage {self.content_id}#{self.position}>'
+
+
+class IndexedPassage(db.Model):
+    """
+    Per-passage statistics for the BM25 inverted index.
+    """
+    passage_id = db.Column(db.Integer, primary_key=True)
+    length = db.Column(db.Integer, nullable=False)  # Weighted token count
+
+    def __repr__(self):
+        return f'<IndexedPassage {self.passage_id}>'
+
+
+class PassagePosting(db.Model):
+    """
+    One posting in the inverted index: a term and its frequency in a passage.
+    """
+    term = db.Column(db.String(100), primary_key=True)
+    passage_id = db.Column(db.Integer, primary_key=True, index=True)
+    tf = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<PassagePosting {self.term}:{self.passage_id}>'
+
+
+class StatsRollup(db.Model):
+    """
+    Running QuestionAnswer aggregates for one period: 'all' or an hour ('2024-01-31T14').
+    """
+    period = db.Column(db.String(16), primary_key=True)
+    total_questions = db.Column(db.Integer, nullable=False, default=0)
+    questions_with_images = db.Column(db.Integer, nullable=False, default=0)
+    response_time_sum = db.Column(db.Float, nullable=False, default=0.0)
+    response_time_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StatsRollup {self.period}>'
+
+
+class LatencyBucket(db.Model):
+    """
+    One bucket of a period's response-time sketch.
+    """
+    period = db.Column(db.String(16), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)  # Log-scale bucket index
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<LatencyBucket {self.period}:{self.bucket}>'
+
+
+class DiscoursePost(db.Model):
+    """
+    A Discourse post ingested through the JSON API. The posts of a topic are
+    combined into one ScrapedContent row for retrieval.
+    """
+    id = db.Column(db.Integer, primary_key=True)  # Discourse post id
+    topic_id = db.Column(db.Integer, nullable=False, index=True)
+    post_number = db.Column(db.Integer, nullable=False)
+    content_id = db.Column(db.Integer, db.ForeignKey('scraped_content.id', ondelete='SET NULL'), index=True)
+    username = db.Column(db.String(100))
+    reply_to_post_number = db.Column(db.Integer)
+    raw = db.Column(db.Text, nullable=False)  # Markdown source of the post
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<DiscoursePost {self.topic_id}#{self.post_number}>'
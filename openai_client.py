@@ -0,0 +1,292 @@
+"""
+Process-wide OpenAI client manager.
+
+One sync and one async client are shared by every request, so HTTP
+connections are pooled and kept alive instead of being set up per question.
+Calls go through a concurrency limit, retry transient failures with jittered
+exponential backoff, and trip a circuit breaker after repeated failures so
+callers can switch to the search-only fallback immediately instead of waiting
+on a failing upstream.
+
+Point OPENAI_BASE_URL at any OpenAI-compatible server (e.g. a local mock) to
+exercise the whole path without the real API.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', 30))
+CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 5))
+MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 2))
+BACKOFF_BASE = float(os.environ.get('OPENAI_BACKOFF_BASE', 0.5))
+BACKOFF_CAP = float(os.environ.get('OPENAI_BACKOFF_CAP', 8))
+MAX_CONCURRENCY = int(os.environ.get('OPENAI_MAX_CONCURRENCY', 16))
+# Calls awaiting a response cost no thread, so the async path may have as many
+# in flight as the ASGI app admits requests (ASYNC_MAX_IN_FLIGHT in asgi.py)
+ASYNC_MAX_CONCURRENCY = int(os.environ.get('OPENAI_ASYNC_MAX_CONCURRENCY',
+                                           os.environ.get('ASYNC_MAX_IN_FLIGHT', 500)))
+QUEUE_TIMEOUT = float(os.environ.get('OPENAI_QUEUE_TIMEOUT', 10))  # Max wait for a concurrency slot
+POOL_SIZE = int(os.environ.get('OPENAI_POOL_SIZE', 32))
+BREAKER_THRESHOLD = int(os.environ.get('OPENAI_BREAKER_THRESHOLD', 5))
+BREAKER_COOLDOWN = float(os.environ.get('OPENAI_BREAKER_COOLDOWN', 30))
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling the API while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and lets a single trial call
+    through once `cooldown` seconds have passed (half-open).
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return 'half-open'
+        return 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("OpenAI circuit breaker closed")
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            was_trial = self._trial_in_progress
+            self._trial_in_progress = False
+            if was_trial or self.failures >= self.threshold:
+                if self.opened_at is None or was_trial:
+                    logger.warning(f"OpenAI circuit breaker opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+    def abandon(self):
+        """
+        A call ended without a verdict on the upstream (cancelled, or a stream
+        the client stopped reading). Frees the half-open trial so the next
+        call can make it, instead of leaving the breaker stuck.
+        """
+        with self._lock:
+            self._trial_in_progress = False
+
+
+def _is_retryable(error: Exception) -> bool:
+    import openai
+    return isinstance(error, (
+        openai.APIConnectionError,  # Includes APITimeoutError
+        openai.RateLimitError,
+        openai.InternalServerError,
+    ))
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: spreads retries from many workers over the whole window
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class OpenAIClientManager:
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self._client = None
+        self._async_client = None
+        self._async_semaphore = None
+        self._semaphore = threading.BoundedSemaphore(MAX_CONCURRENCY)
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return bool(os.environ.get('OPENAI_API_KEY'))
+
+    def _timeout(self):
+        import httpx
+        return httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT)
+
+    def _limits(self, max_connections: int = POOL_SIZE):
+        import httpx
+        return httpx.Limits(max_connections=max(max_connections, POOL_SIZE),
+                            max_keepalive_connections=POOL_SIZE)
+
+    @property
+    def client(self):
+        """
+        Shared sync client with a keep-alive connection pool.
+        Retries are handled here, not by the SDK, so they respect the breaker.
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    import openai
+                    self._client = openai.OpenAI(
+                        api_key=os.environ.get('OPENAI_API_KEY'),
+                        base_url=os.environ.get('OPENAI_BASE_URL'),
+                        max_retries=0,
+                        timeout=self._timeout(),
+                        http_client=httpx.Client(limits=self._limits(), timeout=self._timeout())
+                    )
+        return self._client
+
+    @property
+    def async_client(self):
+        """
+        Shared async client with a keep-alive connection pool.
+        """
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    import httpx
+                    import openai
+                    self._async_client = openai.AsyncOpenAI(
+                        api_key=os.environ.get('OPENAI_API_KEY'),
+                        base_url=os.environ.get('OPENAI_BASE_URL'),
+                        max_retries=0,
+                        timeout=self._timeout(),
+                        http_client=httpx.AsyncClient(limits=self._limits(ASYNC_MAX_CONCURRENCY),
+                                                      timeout=self._timeout())
+                    )
+        return self._async_client
+
+    def _acquire(self):
+        # Fail fast while open instead of queueing behind calls that are failing
+        if self.breaker.state == 'open':
+            raise CircuitOpenError("OpenAI circuit breaker is open")
+        if not self._semaphore.acquire(timeout=QUEUE_TIMEOUT):
+            raise TimeoutError("Timed out waiting for an OpenAI request slot")
+        if not self.breaker.allow():
+            self._semaphore.release()
+            raise CircuitOpenError("OpenAI circuit breaker is open")
+
+    def _record_error(self, error: Exception):
+        # Only upstream trouble counts against the breaker; a rejected
+        # request (bad input, auth) still proves the API is reachable
+        if _is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _create_with_retries(self, **kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                return self.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                if not _is_retryable(e) or attempt == MAX_RETRIES:
+                    self._record_error(e)
+                    raise
+                delay = _backoff(attempt)
+                logger.warning(f"OpenAI request failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def chat_completion(self, **kwargs):
+        """
+        chat.completions.create with concurrency limit, retries and breaker.
+        """
+        self._acquire()
+        try:
+            response = self._create_with_retries(**kwargs)
+            self.breaker.record_success()
+            return response
+        except BaseException as e:
+            if not isinstance(e, Exception):
+                self.breaker.abandon()
+            raise
+        finally:
+            self._semaphore.release()
+
+    def stream_chat_completion(self, **kwargs) -> Iterator:
+        """
+        Streaming chat completion; yields chunks. Retries only happen before
+        the first chunk, and the concurrency slot is held until the stream ends.
+        """
+        self._acquire()
+        try:
+            stream = self._create_with_retries(stream=True, **kwargs)
+            try:
+                for chunk in stream:
+                    yield chunk
+            except Exception as e:
+                self._record_error(e)
+                raise
+            finally:
+                stream.close()
+            self.breaker.record_success()
+        except BaseException as e:
+            # GeneratorExit when the client disconnects mid-stream
+            if not isinstance(e, Exception):
+                self.breaker.abandon()
+            raise
+        finally:
+            self._semaphore.release()
+
+    async def chat_completion_async(self, **kwargs):
+        """
+        Async chat.completions.create with concurrency limit, retries and breaker.
+        """
+        if self.breaker.state == 'open':
+            raise CircuitOpenError("OpenAI circuit breaker is open")
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+        try:
+            await asyncio.wait_for(self._async_semaphore.acquire(), QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Timed out waiting for an OpenAI request slot")
+
+        try:
+            if not self.breaker.allow():
+                raise CircuitOpenError("OpenAI circuit breaker is open")
+
+            for attempt in range(MAX_RETRIES + 1):
+                try:
+                    response = await self.async_client.chat.completions.create(**kwargs)
+                    self.breaker.record_success()
+                    return response
+                except Exception as e:
+                    if not _is_retryable(e) or attempt == MAX_RETRIES:
+                        self._record_error(e)
+                        raise
+                    delay = _backoff(attempt)
+                    logger.warning(f"OpenAI request failed ({e}), retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+        except BaseException as e:
+            # CancelledError when the request is cancelled
+            if not isinstance(e, Exception):
+                self.breaker.abandon()
+            raise
+        finally:
+            self._async_semaphore.release()
+
+
+# Global client manager instance
+client_manager = OpenAIClientManager()
@@ -2,10 +2,11 @@ import trafilatura
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
-import time
 import logging
-from app import app, db
+from app import app, db, initialize_database
 from models import ScrapedContent
+from crawler import Crawler, save_records, stored_validators
+from discourse_ingest import DiscourseIngester
 
 logger = logging.getLogger(__name__)
 
@@ -25,58 +26,22 @@ def get_website_text_content(url: str) -> str:
 
 
 def scrape_discourse_posts(base_url="https://discourse.onlinedegree.iitm.ac.in", 
-                          start_date="2025-01-01", end_date="2025-04-14"):
+                          start_date="2025-01-01", end_date="2025-04-14", crawler=None):
     """
-    Scrape TDS Discourse posts from the specified date range.
-    This is a simplified implementation - in practice, you'd need proper authentication
-    and more sophisticated scraping based on the actual Discourse API.
+    Ingest TDS Discourse posts created in the specified date range.
+    Uses the Discourse JSON API; set DISCOURSE_API_KEY or DISCOURSE_COOKIE
+    if the forum requires login.
     """
-    with app.app_context():
-        # Sample Discourse URLs to scrape (in practice, you'd discover these dynamically)
-        sample_urls = [
-            f"{base_url}/c/tools-in-data-science/6.json",
-            f"{base_url}/t/week-1-tools-in-data-science/1234",
-            f"{base_url}/t/assignment-guidelines/5678",
-        ]
-        
-        for url in sample_urls:
-            try:
-                logger.info(f"Scraping: {url}")
-                
-                # Check if already scraped
-                existing = ScrapedContent.query.filter_by(url=url).first()
-                if existing:
-                    logger.info(f"Already scraped: {url}")
-                    continue
-                
-                content = get_website_text_content(url)
-                if content:
-                    # Extract title from content or URL
-                    title = extract_title_from_content(content) or url.split('/')[-1]
-                    
-                    scraped_content = ScrapedContent(
-                        url=url,
-                        title=title,
-                        content=content,
-                        content_type='discourse'
-                    )
-                    
-                    db.session.add(scraped_content)
-                    db.session.commit()
-                    logger.info(f"Saved content from: {url}")
-                
-                # Be respectful with scraping
-                time.sleep(1)
-                
-            except Exception as e:
-                logger.error(f"Error scraping {url}: {e}")
+    ingester = DiscourseIngester(base_url, crawler=crawler)
+    return ingester.ingest(start_date, end_date)
 
 
-def scrape_course_content():
+def scrape_course_content(crawler=None):
     """
     Scrape TDS course content. This would need to be adapted based on 
     the actual course material location and access methods.
     """
+    initialize_database()
     with app.app_context():
         # Sample course content URLs (replace with actual course material URLs)
         course_urls = [
@@ -84,36 +49,10 @@ def scrape_course_content():
             "https://onlinedegree.iitm.ac.in/course/tools-in-data-science/week2",
             "https://onlinedegree.iitm.ac.in/course/tools-in-data-science/assignments",
         ]
-        
-        for url in course_urls:
-            try:
-                logger.info(f"Scraping course content: {url}")
-                
-                # Check if already scraped
-                existing = ScrapedContent.query.filter_by(url=url).first()
-                if existing:
-                    logger.info(f"Already scraped: {url}")
-                    continue
-                
-                content = get_website_text_content(url)
-                if content:
-                    title = extract_title_from_content(content) or url.split('/')[-1]
-                    
-                    scraped_content = ScrapedContent(
-                        url=url,
-                        title=title,
-                        content=content,
-                        content_type='course'
-                    )
-                    
-                    db.session.add(scraped_content)
-                    db.session.commit()
-                    logger.info(f"Saved course content from: {url}")
-                
-                time.sleep(1)
-                
-            except Exception as e:
-                logger.error(f"Error scraping course content {url}: {e}")
+        validators = stored_validators(course_urls)
+    
+    records = (crawler or Crawler()).crawl(course_urls, content_type='course', validators=validators)
+    return save_records(records)
 
 
 def extract_title_from_content(content: str) -> str:
@@ -133,6 +72,7 @@ def initialize_scraped_data():
     Initialize the database with some sample scraped data for demonstration.
     In production, this would be replaced with actual scraping.
     """
+    initialize_database()
     with app.app_context():
         # Check if we already have data
         if ScrapedContent.query.count() > 0:
@@ -0,0 +1,108 @@
+"""
+Startup bookkeeping: when each lazily loaded component became ready.
+
+Nothing expensive happens at import any more. The database is initialized
+on the first request, and the embedding model and vector index on first
+search. Set STARTUP_WARMUP=1 to load them in a background thread right
+away instead. /api/ready reports the stages below in seconds since import:
+
+    import      app and routes imported
+    database    tables created and seed data loaded
+    model       embedding model loaded
+    index       vector index loaded or built
+    warmup      background warm-up finished
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+IMPORT_STARTED = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+WARMUP = os.environ.get('STARTUP_WARMUP', '').lower() in ('1', 'true', 'yes')
+
+_stages: Dict[str, Dict[str, float]] = {}
+_errors: Dict[str, str] = {}
+_warmup_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+
+
+def since_import() -> float:
+    return time.perf_counter() - IMPORT_STARTED
+
+
+def mark(stage: str, took: float = 0.0):
+    """
+    Record that a stage finished now, after `took` seconds of work.
+    """
+    with _lock:
+        _stages[stage] = {'ready_at': round(since_import(), 3), 'took': round(took, 3)}
+        _errors.pop(stage, None)  # A retry succeeded
+    logger.info(f"Startup stage '{stage}' ready {since_import():.2f}s after import (took {took:.2f}s)")
+
+
+def fail(stage: str, error: Exception):
+    """
+    Record that a stage failed. It stays unready until a later mark().
+    """
+    with _lock:
+        _errors[stage] = str(error)
+
+
+def is_ready(stage: str) -> bool:
+    return stage in _stages
+
+
+def required_stages():
+    # Without warm-up the model and index load on first search instead
+    return ('database', 'model', 'index') if WARMUP else ('database',)
+
+
+def status() -> Dict:
+    """
+    Readiness summary for /api/ready.
+    """
+    with _lock:
+        stages = dict(_stages)
+        errors = dict(_errors)
+    return {
+        'ready': all(stage in stages and stage not in errors for stage in required_stages()),
+        'uptime': round(since_import(), 3),
+        'stages': stages,
+        'errors': errors,
+        'warmup': WARMUP
+    }
+
+
+def warm_up():
+    """
+    Initialize the database, load the embedding model and load the vector index.
+    """
+    started = time.perf_counter()
+    try:
+        from app import app, initialize_database
+        from vector_store import vector_store
+
+        initialize_database()
+        vector_store.model  # Loads the encoder
+        with app.app_context():
+            vector_store.ensure_loaded()
+        mark('warmup', time.perf_counter() - started)
+    except Exception as e:
+        fail('warmup', e)
+        logger.error(f"Warm-up failed: {e}")
+
+
+def start_warmup() -> threading.Thread:
+    """
+    Run warm_up() in a daemon thread (once per process).
+    """
+    global _warmup_thread
+    with _lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warm_up, name='startup-warmup', daemon=True)
+            _warmup_thread.start()
+        return _warmup_thread
@@ -40,8 +40,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 requestData.image = await fileToBase64(imageFile);
             }
             
-            // Submit to API
-            const response = await fetch('/api/', {
+            // Submit to the streaming API
+            const response = await fetch('/api/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -49,16 +49,15 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: JSON.stringify(requestData)
             });
             
-            const data = await response.json();
-            const responseTime = Date.now() - startTime;
-            
-            if (response.ok) {
-                showResponse(data, responseTime);
-                loadStats(); // Refresh stats
-            } else {
+            if (!response.ok) {
+                const data = await response.json();
                 showError(data.error || 'An error occurred');
+                return;
             }
             
+            await readAnswerStream(response, startTime);
+            loadStats(); // Refresh stats
+            
         } catch (error) {
             console.error('Error:', error);
             showError('Network error: ' + error.message);
@@ -67,6 +66,64 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    async function readAnswerStream(response, startTime) {
+        // Render Server-Sent Events from /api/stream as they arrive
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let answer = '';
+        let started = false;
+        
+        function handleEvent(event, data) {
+            if (!started && event !== 'error') {
+                started = true;
+                hideLoading();
+                showResponse({ answer: '', links: [] }, Date.now() - startTime);
+                document.getElementById('responseTime').textContent = '...';
+            }
+            
+            if (event === 'links') {
+                showLinks(data);
+            } else if (event === 'token') {
+                answer += data;
+                document.getElementById('answerText').innerHTML = formatAnswer(answer);
+            } else if (event === 'reset') {
+                answer = '';
+                document.getElementById('answerText').innerHTML = '';
+            } else if (event === 'done') {
+                const responseTime = Date.now() - startTime;
+                document.getElementById('responseTime').textContent = (responseTime / 1000).toFixed(2) + 's';
+            } else if (event === 'error') {
+                showError(data.error || 'An error occurred');
+            }
+        }
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let event = 'message';
+                const dataLines = [];
+                for (const line of block.split('\n')) {
+                    if (line.startsWith('event:')) {
+                        event = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataLines.push(line.slice(5).trim());
+                    }
+                }
+                if (dataLines.length > 0) {
+                    handleEvent(event, JSON.parse(dataLines.join('\n')));
+                }
+            }
+        }
+    }
+    
     function fileToBase64(file) {
         return new Promise((resolve, reject) => {
             const reader = new FileReader();
@@ -99,25 +156,33 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('responseTime').textContent = (responseTime / 1000).toFixed(2) + 's';
         
         // Show links if available
-        if (data.links && data.links.length > 0) {
-            const linksSection = document.getElementById('linksSection');
-            const linksList = document.getElementById('linksList');
-            
-            linksList.innerHTML = data.links.map(link => `
-                <div class="mb-2">
-                    <a href="${escapeHtml(link.url)}" target="_blank" class="text-decoration-none">
-                        <i class="fas fa-external-link-alt me-2"></i>
-                        ${escapeHtml(link.text)}
-                    </a>
-                </div>
-            `).join('');
-            
-            linksSection.classList.remove('d-none');
-        }
+        showLinks(data.links);
         
         responseCard.classList.remove('d-none');
     }
     
+    function showLinks(links) {
+        const linksSection = document.getElementById('linksSection');
+        const linksList = document.getElementById('linksList');
+        
+        if (!links || links.length === 0) {
+            linksList.innerHTML = '';
+            linksSection.classList.add('d-none');
+            return;
+        }
+        
+        linksList.innerHTML = links.map(link => `
+            <div class="mb-2">
+                <a href="${escapeHtml(link.url)}" target="_blank" class="text-decoration-none">
+                    <i class="fas fa-external-link-alt me-2"></i>
+                    ${escapeHtml(link.text || link.title || link.url)}
+                </a>
+            </div>
+        `).join('');
+        
+        linksSection.classList.remove('d-none');
+    }
+    
     function showError(message) {
         hideAll();
         document.getElementById('errorText').textContent = message;
@@ -0,0 +1,269 @@
+"""
+Incrementally maintained QuestionAnswer statistics for /api/stats.
+
+Every batch written by the analytics writer also bumps running totals in the
+same transaction: one StatsRollup row for all time plus one per hour, each
+with a latency sketch stored as LatencyBucket counts. Reading the stats then
+touches a fixed number of rows however long the question history grows.
+
+Counters are updated with atomic `col = col + n` upserts, so several worker
+processes can write concurrently without losing increments.
+"""
+import logging
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import QuestionAnswer, StatsRollup, LatencyBucket
+
+logger = logging.getLogger(__name__)
+
+ALL_TIME = 'all'
+HOUR_FORMAT = '%Y-%m-%dT%H'
+PERCENTILES = (50, 95, 99)
+
+RELATIVE_ACCURACY = 0.01  # Max relative error of reported percentiles
+MIN_LATENCY = 0.001  # Seconds; faster responses share the lowest bucket
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+_COUNTERS = ('total_questions', 'questions_with_images', 'response_time_sum', 'response_time_count')
+
+
+class LatencySketch:
+    """
+    Log-bucketed latency histogram in the spirit of HDR histogram / DDSketch.
+    Bucket i covers (gamma**(i-1), gamma**i] seconds, so any quantile is
+    reported within RELATIVE_ACCURACY of the true value, and two sketches
+    merge exactly by adding their bucket counts.
+    """
+
+    def __init__(self, buckets: Optional[Dict[int, int]] = None):
+        self.buckets = Counter(buckets or {})
+
+    @staticmethod
+    def bucket_of(value: float) -> int:
+        return int(math.ceil(math.log(max(value, MIN_LATENCY)) / _LOG_GAMMA))
+
+    @property
+    def count(self) -> int:
+        return sum(self.buckets.values())
+
+    def add(self, value: float, count: int = 1):
+        self.buckets[self.bucket_of(value)] += count
+
+    def merge(self, other: 'LatencySketch'):
+        self.buckets.update(other.buckets)
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                # Midpoint (in relative terms) of the bucket's range
+                return 2 * _GAMMA ** bucket / (_GAMMA + 1)
+        return 2 * _GAMMA ** max(self.buckets) / (_GAMMA + 1)
+
+    def percentiles(self) -> Dict[str, Optional[float]]:
+        return {f"p{p}": _round(self.quantile(p / 100)) for p in PERCENTILES}
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+class _Aggregate:
+    def __init__(self):
+        self.total_questions = 0
+        self.questions_with_images = 0
+        self.response_time_sum = 0.0
+        self.response_time_count = 0
+        self.sketch = LatencySketch()
+
+    def add(self, has_image: bool, response_time: Optional[float]):
+        self.total_questions += 1
+        if has_image:
+            self.questions_with_images += 1
+        if response_time is not None:
+            self.response_time_sum += response_time
+            self.response_time_count += 1
+            self.sketch.add(response_time)
+
+
+def _accumulate(aggregates: Dict[str, _Aggregate], rows: Iterable[Dict]):
+    for row in rows:
+        created_at = row.get('created_at') or datetime.utcnow()
+        for period in (ALL_TIME, created_at.strftime(HOUR_FORMAT)):
+            aggregates[period].add(row.get('has_image'), row.get('response_time'))
+
+
+def _dialect_insert(connection):
+    """
+    The dialect's INSERT construct with ON CONFLICT support, or None.
+    """
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def _upsert(connection, table, key_columns: List[str], rows: List[Dict]):
+    """
+    Insert rows, or add their non-key values to the existing row.
+    """
+    if not rows:
+        return
+    value_columns = [name for name in rows[0] if name not in key_columns]
+
+    dialect_insert = _dialect_insert(connection)
+    if dialect_insert is not None:
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={name: table.c[name] + stmt.excluded[name] for name in value_columns}
+        )
+        connection.execute(stmt, rows)
+        return
+
+    for row in rows:
+        where = [table.c[name] == row[name] for name in key_columns]
+        result = connection.execute(
+            update(table).where(*where).values({name: table.c[name] + row[name] for name in value_columns})
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(row))
+
+
+def _write(connection, aggregates: Dict[str, _Aggregate]):
+    _upsert(connection, StatsRollup.__table__, ['period'], [
+        {'period': period, **{name: getattr(aggregate, name) for name in _COUNTERS}}
+        for period, aggregate in aggregates.items()
+    ])
+    _upsert(connection, LatencyBucket.__table__, ['period', 'bucket'], [
+        {'period': period, 'bucket': bucket, 'count': count}
+        for period, aggregate in aggregates.items()
+        for bucket, count in aggregate.sketch.buckets.items()
+    ])
+
+
+def record_batch(connection, rows: List[Dict]):
+    """
+    Add a batch of QuestionAnswer rows (as inserted by the analytics writer)
+    to the rollups, inside the caller's transaction.
+    """
+    aggregates = defaultdict(_Aggregate)
+    _accumulate(aggregates, rows)
+    _write(connection, aggregates)
+
+
+def _claim(connection, period: str) -> bool:
+    """
+    Insert an empty rollup row for the period, inside the caller's
+    transaction. Returns False if the row already exists.
+    """
+    table = StatsRollup.__table__
+    row = {'period': period, **{name: 0 for name in _COUNTERS}}
+    dialect_insert = _dialect_insert(connection)
+    if dialect_insert is not None:
+        stmt = dialect_insert(table).values(row).on_conflict_do_nothing(index_elements=['period'])
+        return connection.execute(stmt).rowcount == 1
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(table).values(row))
+        return True
+    except IntegrityError:
+        return False
+
+
+def backfill(batch_size: int = 1000):
+    """
+    Build the rollups from existing QuestionAnswer rows the first time they
+    are needed. Does nothing once the all-time row exists.
+
+    The all-time row is inserted first and the history read and added in
+    the same transaction, so exactly one of several workers starting
+    together backfills, and analytics batches (which update that row) wait
+    for the backfill to commit instead of being counted twice.
+    """
+    try:
+        if db.session.get(StatsRollup, ALL_TIME) is not None:
+            return
+        if not _claim(db.session.connection(), ALL_TIME):
+            db.session.rollback()
+            return
+
+        aggregates = defaultdict(_Aggregate)
+        aggregates[ALL_TIME]  # Written even when there is no history yet
+        rows = db.session.execute(
+            select(QuestionAnswer.has_image, QuestionAnswer.response_time, QuestionAnswer.created_at)
+            .execution_options(yield_per=batch_size)
+        )
+        for partition in rows.partitions():
+            _accumulate(aggregates, (row._mapping for row in partition))
+
+        _write(db.session.connection(), aggregates)
+        db.session.commit()
+        logger.info(f"Backfilled stats rollups from {aggregates[ALL_TIME].total_questions} questions")
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error backfilling stats rollups: {e}")
+
+
+def _sketch(periods: List[str]) -> LatencySketch:
+    sketch = LatencySketch()
+    rows = db.session.execute(
+        select(LatencyBucket.bucket, LatencyBucket.count).where(LatencyBucket.period.in_(periods))
+    )
+    for bucket, count in rows:
+        sketch.buckets[bucket] += count
+    return sketch
+
+
+def _summary(rollup: Optional[StatsRollup]) -> Dict:
+    if rollup is None or not rollup.response_time_count:
+        average = 0.0
+    else:
+        average = round(rollup.response_time_sum / rollup.response_time_count, 2)
+    return {
+        "total_questions": rollup.total_questions if rollup else 0,
+        "questions_with_images": rollup.questions_with_images if rollup else 0,
+        "average_response_time": average
+    }
+
+
+def get_stats(hours: int = 0) -> Dict:
+    """
+    All-time totals and latency percentiles, plus per-hour figures for the
+    last `hours` hours when requested.
+    """
+    stats = _summary(db.session.get(StatsRollup, ALL_TIME))
+    stats["latency_percentiles"] = _sketch([ALL_TIME]).percentiles()
+
+    if hours > 0:
+        now = datetime.utcnow()
+        periods = [(now - timedelta(hours=i)).strftime(HOUR_FORMAT) for i in range(hours)]
+        rollups = {
+            rollup.period: rollup
+            for rollup in db.session.execute(
+                select(StatsRollup).where(StatsRollup.period.in_(periods))
+            ).scalars()
+        }
+        stats["hourly"] = [
+            {"hour": period, **_summary(rollups.get(period))}
+            for period in reversed(periods)
+        ]
+        stats["window_latency_percentiles"] = _sketch(periods).percentiles()
+
+    return stats
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app reads DATABASE_URL at import: keep tests away from instance/
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
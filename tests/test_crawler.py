@@ -0,0 +1,130 @@
+"""
+Crawler rate limiting, conditional re-fetches and failure isolation, with
+an injected requests.Session standing in for the network.
+"""
+import threading
+import time
+
+import requests
+
+from crawler import Crawler, TokenBucket, content_hash
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=20, burst=3)
+    started = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - started < 0.05
+
+    for _ in range(4):
+        bucket.acquire()
+    # Four more tokens at 20 per second
+    assert time.monotonic() - started >= 0.18
+
+
+def test_token_bucket_pause_blocks_acquisitions():
+    bucket = TokenBucket(rate=1000, burst=5)
+    bucket.pause(0.2)
+    started = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - started >= 0.18
+
+
+class FixtureSession(requests.Session):
+    """
+    Serves pages that carry an ETag and answer a matching If-None-Match
+    with 304. URLs in `broken` raise a non-requests exception.
+    """
+
+    def __init__(self, pages, broken=()):
+        super().__init__()
+        self.pages = pages
+        self.broken = set(broken)
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, **kwargs):
+        headers = headers or {}
+        with self._lock:
+            self.requests.append((url, dict(headers)))
+        if url in self.broken:
+            raise ValueError("malformed response")
+
+        response = requests.Response()
+        response.url = url
+        html = self.pages.get(url)
+        if html is None:
+            response.status_code = 404
+            response._content = b''
+            return response
+        etag = f'"{content_hash(html)[:16]}"'
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = 'Wed, 01 Jan 2025 00:00:00 GMT'
+        if headers.get('If-None-Match') == etag:
+            response.status_code = 304
+            response._content = b''
+        else:
+            response.status_code = 200
+            response._content = html.encode('utf-8')
+        return response
+
+    def requested(self, url):
+        return [headers for requested_url, headers in self.requests if requested_url == url]
+
+
+def _extract(html):
+    return html.split('|')[0], html
+
+
+def _crawler(session):
+    return Crawler(session=session, rate=1000, burst=1000, extract_workers=0)
+
+
+PAGES = {
+    'http://site.test/a': 'Page A|Alpha content',
+    'http://site.test/b': 'Page B|Beta content',
+}
+
+
+def test_recrawl_sends_validators_and_skips_not_modified_pages():
+    session = FixtureSession(PAGES)
+    records = _crawler(session).crawl(list(PAGES), 'course', extractor=_extract)
+    assert sorted(record['url'] for record in records) == sorted(PAGES)
+    validators = {record['url']: {'etag': record['etag'], 'last_modified': record['last_modified']}
+                  for record in records}
+
+    # Page B changes between crawls
+    pages = dict(PAGES, **{'http://site.test/b': 'Page B|Beta content, revised'})
+    session = FixtureSession(pages)
+    records = _crawler(session).crawl(list(pages), 'course', extractor=_extract, validators=validators)
+
+    assert [record['url'] for record in records] == ['http://site.test/b']
+    assert records[0]['content'] == 'Page B|Beta content, revised'
+    assert records[0]['content_hash'] == content_hash('Page B|Beta content, revised')
+    sent = session.requested('http://site.test/a')[0]
+    assert sent['If-None-Match'] == validators['http://site.test/a']['etag']
+    assert sent['If-Modified-Since'] == 'Wed, 01 Jan 2025 00:00:00 GMT'
+
+
+def test_fetch_page_reports_not_modified():
+    session = FixtureSession(PAGES)
+    crawler = _crawler(session)
+    page = crawler._fetch_page('http://site.test/a')
+    assert page['html'] == PAGES['http://site.test/a']
+    assert crawler._fetch_page('http://site.test/a', {'etag': page['etag']}) == {'not_modified': True}
+
+
+def test_unexpected_fetch_error_does_not_abort_the_crawl():
+    session = FixtureSession(PAGES, broken=['http://site.test/a'])
+    records = _crawler(session).crawl(list(PAGES), 'course', extractor=_extract)
+    assert [record['url'] for record in records] == ['http://site.test/b']
+
+
+def test_robots_txt_fetched_once_per_host():
+    session = FixtureSession(PAGES)
+    crawler = Crawler(session=session, concurrency=8, rate=1000, burst=1000, extract_workers=0)
+    urls = [f'http://site.test/a?{i}' for i in range(16)] + [f'http://other.test/{i}' for i in range(4)]
+    crawler.crawl(urls, 'course', extractor=_extract)
+    assert len(session.requested('http://site.test/robots.txt')) == 1
+    assert len(session.requested('http://other.test/robots.txt')) == 1
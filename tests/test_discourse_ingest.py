@@ -0,0 +1,127 @@
+"""
+DiscourseIngester fed with saved Discourse API payloads through an injected
+requests.Session: latest.json, /t/{id}.json and posts.json.
+"""
+import json
+import os
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from app import app, db, initialize_database
+from models import DiscoursePost, ScrapedContent
+from crawler import Crawler
+from discourse_ingest import DiscourseIngester, POSTS_PER_REQUEST
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'discourse')
+BASE_URL = 'https://discourse.example.test'
+
+
+def _load(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+class FixtureSession(requests.Session):
+    """
+    Serves the saved payloads and records every URL requested.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.requested = []
+        self.posts = _load('posts.json')['post_stream']['posts']
+
+    def get(self, url, **kwargs):
+        self.requested.append(url)
+        parsed = urlparse(url)
+        params = parse_qs(parsed.query)
+        path = parsed.path
+
+        if path == '/c/tools-in-data-science/6/l/latest.json':
+            payload = _load('latest.json') if params.get('page') == ['0'] else {'topic_list': {'topics': []}}
+        elif path.startswith('/t/') and path.endswith('/posts.json'):
+            ids = {int(post_id) for post_id in params.get('post_ids[]', [])}
+            payload = {'post_stream': {'posts': [post for post in self.posts if post['id'] in ids]}}
+        elif path.startswith('/t/') and path.endswith('.json'):
+            name = f"t_{path[len('/t/'):-len('.json')]}.json"
+            payload = _load(name) if os.path.exists(os.path.join(FIXTURES, name)) else None
+        else:
+            payload = None  # robots.txt included: everything is allowed
+
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200 if payload is not None else 404
+        response._content = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        response.headers['Content-Type'] = 'application/json'
+        return response
+
+    def posts_requests(self, topic_id):
+        return [parse_qs(urlparse(url).query)['post_ids[]'] for url in self.requested
+                if urlparse(url).path == f'/t/{topic_id}/posts.json']
+
+
+@pytest.fixture
+def session():
+    initialize_database()
+    with app.app_context():
+        db.session.execute(db.delete(DiscoursePost))
+        db.session.execute(db.delete(ScrapedContent).where(ScrapedContent.content_type == 'discourse'))
+        db.session.commit()
+    return FixtureSession()
+
+
+def _ingest(session):
+    crawler = Crawler(session=session, rate=1000, burst=1000, extract_workers=0)
+    return DiscourseIngester(BASE_URL, session=session, crawler=crawler).ingest('2025-01-01', '2025-04-14')
+
+
+def test_keeps_only_posts_created_inside_the_window(session):
+    _ingest(session)
+
+    with app.app_context():
+        stored = db.session.execute(db.select(DiscoursePost)).scalars().all()
+        assert {post.topic_id for post in stored} == {101, 104}
+        # Topic 101 started before the window and ran past it
+        assert sorted(post.post_number for post in stored if post.topic_id == 101) == list(range(6, 44))
+        assert all(post.created_at.year == 2025 and post.created_at.month <= 4 for post in stored)
+
+    # The old pinned topic and the one created after the window are never opened
+    paths = {urlparse(url).path for url in session.requested}
+    assert '/t/102.json' not in paths
+    assert '/t/103.json' not in paths
+
+
+def test_fetches_posts_in_chunks_of_twenty(session):
+    _ingest(session)
+
+    chunks = session.posts_requests(101)
+    assert POSTS_PER_REQUEST == 20
+    assert [len(chunk) for chunk in chunks] == [20, 20, 5]
+    stream = _load('t_101.json')['post_stream']['stream']
+    assert [int(post_id) for chunk in chunks for post_id in chunk] == stream
+    assert [len(chunk) for chunk in session.posts_requests(104)] == [3]
+
+
+def test_stores_one_scraped_content_row_per_topic(session):
+    assert _ingest(session) == 2
+    # Re-ingesting the same posts changes nothing
+    assert _ingest(FixtureSession()) == 0
+
+    with app.app_context():
+        rows = db.session.execute(
+            db.select(ScrapedContent).where(ScrapedContent.content_type == 'discourse')
+        ).scalars().all()
+        assert sorted(row.url for row in rows) == [
+            f'{BASE_URL}/t/ga2-docker-questions/101',
+            f'{BASE_URL}/t/project-1-deadline/104',
+        ]
+        topic = next(row for row in rows if row.url.endswith('/104'))
+        assert topic.title == 'Project 1 deadline'
+        assert topic.content.startswith('student1: Reply 1 on the Project 1 deadline.')
+        # Posts point at their topic's row
+        linked = db.session.execute(
+            db.select(DiscoursePost.content_id).where(DiscoursePost.topic_id == 104)
+        ).scalars().all()
+        assert linked == [topic.id] * 3
@@ -0,0 +1,121 @@
+"""
+Circuit breaker behavior of OpenAIClientManager against a local
+OpenAI-compatible server (OPENAI_BASE_URL).
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from openai_client import OpenAIClientManager
+
+
+def _chunk(content):
+    data = json.dumps({
+        'id': 'mock', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'mock',
+        'choices': [{'index': 0, 'delta': {'content': content}, 'finish_reason': None}]
+    })
+    return f"data: {data}\n\n".encode()
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if body.get('model') == 'slow':
+            time.sleep(2)
+        if body.get('stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                for word in ('Hello', ' there', '!'):
+                    self._write_chunk(_chunk(word))
+                    time.sleep(0.05)
+                self._write_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b'0\r\n\r\n')
+            except OSError:
+                pass  # The client went away
+            return
+        data = json.dumps({
+            'id': 'mock', 'object': 'chat.completion', 'created': 0, 'model': 'mock',
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'Mock answer'},
+                         'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockOpenAIHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    monkeypatch.setenv('OPENAI_BASE_URL', f'http://127.0.0.1:{server.server_port}/v1')
+    yield OpenAIClientManager()
+    server.shutdown()
+    server.server_close()
+
+
+def _half_open(manager):
+    breaker = manager.breaker
+    breaker.failures = breaker.threshold
+    breaker.opened_at = time.monotonic() - breaker.cooldown - 1
+    assert breaker.state == 'half-open'
+
+
+MESSAGES = [{'role': 'user', 'content': 'Hi'}]
+
+
+def test_half_open_trial_success_closes_breaker(manager):
+    _half_open(manager)
+    response = manager.chat_completion(model='mock', messages=MESSAGES)
+    assert response.choices[0].message.content == 'Mock answer'
+    assert manager.breaker.state == 'closed'
+
+
+def test_abandoned_stream_frees_half_open_trial(manager):
+    _half_open(manager)
+    stream = manager.stream_chat_completion(model='mock', messages=MESSAGES)
+    next(stream)
+    # While the trial is running no other call gets through
+    assert not manager.breaker.allow()
+    stream.close()  # What a disconnected SSE client does to the generator
+
+    assert manager.breaker.state == 'half-open'
+    response = manager.chat_completion(model='mock', messages=MESSAGES)
+    assert response.choices[0].message.content == 'Mock answer'
+    assert manager.breaker.state == 'closed'
+
+
+def test_cancelled_async_call_frees_half_open_trial(manager):
+    _half_open(manager)
+
+    async def cancel_trial():
+        task = asyncio.ensure_future(manager.chat_completion_async(model='slow', messages=MESSAGES))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert manager.breaker.state == 'half-open'
+    assert manager.breaker.allow()
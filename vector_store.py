@@ -1,145 +1,729 @@
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
-import pickle
+import json
 import os
+import time
 import logging
+import tempfile
+import threading
+from array import array
+from contextlib import contextmanager
 from typing import List, Tuple
-from app import app
-from models import ScrapedContent
+from sqlalchemy import func
+from app import app, db, initialize_database
+from models import ScrapedContent, ContentPassage
+from doc_store import DocStore, DocStoreWriter, AppendableDocStore
+from write_ahead_log import WriteAheadLog
+import ann_index
+from embedding_cache import QueryEmbeddingCache
+from encoders import get_encoder, BACKEND
+import startup
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
+# Checkpoint the write-ahead log once it grows past this size or age
+CHECKPOINT_BYTES = int(os.environ.get('VECTOR_WAL_CHECKPOINT_BYTES', 64 * 1024 * 1024))
+CHECKPOINT_SECONDS = float(os.environ.get('VECTOR_WAL_CHECKPOINT_SECONDS', 300))
+
+# Rebuild the index once this fraction of its vectors belongs to replaced documents,
+# and there are at least this many of them (small corpora reach the ratio after a few edits)
+COMPACT_RATIO = float(os.environ.get('VECTOR_COMPACT_RATIO', 0.2))
+COMPACT_MIN_DELETED = int(os.environ.get('VECTOR_COMPACT_MIN_DELETED', 1000))
+
+# Index type ('flat', 'ivf', 'hnsw' or 'ivfpq') and its query-time knobs
+INDEX_TYPE = os.environ.get('VECTOR_INDEX_TYPE', 'flat').lower()
+NPROBE = int(os.environ.get('VECTOR_NPROBE', 8))
+EF_SEARCH = int(os.environ.get('VECTOR_EF_SEARCH', 64))
+TRAIN_SAMPLE_SIZE = int(os.environ.get('VECTOR_TRAIN_SAMPLE_SIZE', 50000))
+
+# Full rebuilds: passages read from the database per chunk, encode batch size
+# and encoder processes (1 encodes in-process)
+REBUILD_CHUNK_SIZE = int(os.environ.get('VECTOR_REBUILD_CHUNK_SIZE', 2048))
+ENCODE_BATCH_SIZE = int(os.environ.get('VECTOR_ENCODE_BATCH_SIZE', 64))
+ENCODE_WORKERS = int(os.environ.get('VECTOR_ENCODE_WORKERS', 1))
+PROGRESS_SECONDS = 10  # Interval between rebuild progress log lines
+
+# Serving several processes from one data directory (see gunicorn.conf.py):
+# memory-map index files so processes share them, and how often (seconds) to
+# check for a generation published, or write-ahead log records appended, by
+# another process (0 disables)
+INDEX_MMAP = os.environ.get('VECTOR_INDEX_MMAP', '').lower() in ('1', 'true', 'yes')
+RELOAD_INTERVAL = float(os.environ.get('VECTOR_RELOAD_INTERVAL', 30))
+
+# Query embedding cache size and optional on-disk tier (SQLite file path)
+QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE', 1024))
+QUERY_CACHE_PATH = os.environ.get('QUERY_CACHE_PATH')
+QUERY_CACHE_DISK_SIZE = int(os.environ.get('QUERY_CACHE_DISK_SIZE', 100000))
+
 
 class VectorStore:
-    def __init__(self, model_name='all-MiniLM-L6-v2'):
+    def __init__(self, model_name='all-MiniLM-L6-v2', data_dir='.', index_type=None, backend=None):
         """
-        Initialize vector store with a lightweight sentence transformer model.
+        Initialize vector store with a lightweight sentence transformer model,
+        run on the configured embedding backend (see encoders.py).
+        
+        Nothing is loaded here: the model is loaded on first encode and the
+        index on first search or update (see ensure_loaded).
         """
-        self.model = SentenceTransformer(model_name)
-        self.dimension = 384  # Dimension for all-MiniLM-L6-v2
+        self.model_name = model_name
+        self.backend = (backend or BACKEND).lower()
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._wal = None
         self.index = None
-        self.documents = []
-        self.index_file = 'vector_index.faiss'
-        self.docs_file = 'documents.pkl'
-        
+        self.index_type = index_type or INDEX_TYPE
+        self.nprobe = NPROBE
+        self.ef_search = EF_SEARCH
+        self.query_cache = QueryEmbeddingCache(QUERY_CACHE_SIZE, QUERY_CACHE_PATH,
+                                              namespace=f"{model_name}:{self.backend}",
+                                              disk_maxsize=QUERY_CACHE_DISK_SIZE)
+        self.documents = AppendableDocStore()
+        self.deleted = set()  # Positions of tombstoned (replaced or removed) passages
+        self.data_dir = data_dir
+        self.manifest_file = os.path.join(data_dir, 'vector_store.json')
+        self.lock_file = os.path.join(data_dir, 'vector_store.lock')
+        self.generation = 0
+        self._mapped = False  # self.index is memory-mapped and read-only
+        self._manifest_stat = None
+        self._wal_offset = 0  # How far into the write-ahead log this process has replayed
+        self._last_reload_check = time.time()
+        self._last_checkpoint = time.time()
+        self._compaction = None  # Background rebuild thread, while one runs
+        self._lock = threading.RLock()
+    
+    @property
+    def model(self):
+        """
+        The encoder, loaded on first use. Threads racing to use it wait for
+        a single load.
+        """
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    self._model = get_encoder(self.backend, self.model_name)
+                    startup.mark('model', time.perf_counter() - started)
+        return self._model
+    
+    @property
+    def dimension(self) -> int:
+        return self.model.dimension  # 384 for all-MiniLM-L6-v2
+    
+    @property
+    def wal(self) -> WriteAheadLog:
+        # Created lazily because reading frames needs the model's dimension
+        if self._wal is None:
+            self._wal = WriteAheadLog(os.path.join(self.data_dir, 'vector_store.wal'), self.dimension)
+        return self._wal
+    
+    def ensure_loaded(self):
+        """
+        Load or build the index if this is its first use. Needs an app context.
+        """
+        if self.index is not None:
+            return
+        with self._lock:
+            if self.index is None:
+                started = time.perf_counter()
+                self.load_or_create_index()
+                startup.mark('index', time.perf_counter() - started)
+    
+    def _index_file(self, generation: int) -> str:
+        return os.path.join(self.data_dir, f'vector_index.{generation}.faiss')
+    
+    def _docs_file(self, generation: int) -> str:
+        return os.path.join(self.data_dir, f'documents.{generation}.bin')
+    
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """
+        Cross-process lock on the data directory: publishing a generation
+        takes it exclusively, loading one takes it shared, so a process never
+        reads a manifest whose log has not been reset or files being removed.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_file, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def _stat_manifest(self):
+        try:
+            st = os.stat(self.manifest_file)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+    
     def load_or_create_index(self):
         """
-        Load existing index or create new one from database content.
+        Load the last checkpoint and replay the write-ahead log,
+        or create a new index from database content.
+        """
+        initialize_database()  # No-op once done; scripts may load before any request
+        with self._lock:
+            if os.path.exists(self.manifest_file):
+                try:
+                    self._load_checkpoint()
+                    return
+                except Exception as e:
+                    logger.error(f"Error loading index: {e}")
+            
+            # Create new index
+            self.create_index()
+    
+    def _load_checkpoint(self):
+        """
+        Replace the in-memory state with the current generation on disk plus
+        its write-ahead log. Call with the lock held; leaves the state
+        untouched if the generation cannot be read.
+        """
+        with self._file_lock(exclusive=False):
+            manifest_stat = self._stat_manifest()
+            with open(self.manifest_file) as f:
+                manifest = json.load(f)
+            generation = manifest['generation']
+            index = ann_index.read_index(self._index_file(generation), mmap=INDEX_MMAP)
+            documents = AppendableDocStore(DocStore(self._docs_file(generation)))
+            if index.ntotal != len(documents) or manifest['count'] != len(documents):
+                documents.close()
+                raise ValueError(f"index has {index.ntotal} vectors but {len(documents)} documents")
+            
+            old_documents = self.documents
+            self.index = index
+            self._mapped = INDEX_MMAP
+            self.documents = documents
+            self.deleted = set(manifest.get('deleted', []))
+            self.generation = generation
+            self._manifest_stat = manifest_stat
+            self._last_checkpoint = time.time()
+            old_documents.close()
+            
+            replayed = self._replay_wal()
+        logger.info(f"Loaded vector index generation {generation}, replayed {replayed} logged documents")
+    
+    def reload_if_changed(self) -> bool:
+        """
+        Switch to a generation another process (a rebuild or re-crawl job, or
+        another worker) has published since this one was loaded, or replay
+        what it has logged to the current generation's write-ahead log since
+        this process last read it. Searches keep using the old state until
+        the new one is ready.
         """
-        if os.path.exists(self.index_file) and os.path.exists(self.docs_file):
+        manifest_stat = self._stat_manifest()
+        if self.index is None or manifest_stat is None:
+            return False
+        if manifest_stat == self._manifest_stat:
+            if self.wal.size() <= self._wal_offset:
+                return False
+            return self._replay_wal_tail()
+        with self._lock:
+            if self._stat_manifest() == self._manifest_stat:
+                return False
+            previous = self.generation
             try:
-                self.index = faiss.read_index(self.index_file)
-                with open(self.docs_file, 'rb') as f:
-                    self.documents = pickle.load(f)
-                logger.info("Loaded existing vector index")
-                return
+                self._load_checkpoint()
             except Exception as e:
-                logger.error(f"Error loading index: {e}")
+                # Typically a generation replaced while it was being read; retry next time
+                logger.warning(f"Could not reload vector index: {e}")
+                return False
+        logger.info(f"Hot-swapped vector index generation {previous} for {self.generation}")
+        return True
+    
+    def _replay_wal_tail(self) -> bool:
+        """
+        Apply records appended to the write-ahead log by other processes.
+        """
+        with self._lock, self._file_lock(exclusive=False):
+            if self._stat_manifest() != self._manifest_stat:
+                return False  # Superseded by a new generation; loaded on the next check
+            start = self._wal_offset
+            replayed = self._replay_wal(start, truncate=False)
+        if self._wal_offset == start:
+            return False
+        logger.info(f"Caught up on {self._wal_offset - start} bytes of write-ahead log "
+                    f"({replayed} new documents)")
+        return True
+    
+    def _maybe_reload(self):
+        if RELOAD_INTERVAL <= 0 or time.time() - self._last_reload_check < RELOAD_INTERVAL:
+            return
+        self._last_reload_check = time.time()
+        self.reload_if_changed()
+    
+    def _writable_index(self) -> faiss.Index:
+        """
+        The index, first swapped for a private copy if it is memory-mapped.
+        Call with the lock held before adding vectors.
+        """
+        if self._mapped:
+            logger.info("Copying memory-mapped vector index into memory to add documents")
+            self.index = ann_index.owned_copy(self.index)
+            self._mapped = False
+        return self.index
+    
+    def _replay_wal(self, start: int = 0, truncate: bool = True) -> int:
+        """
+        Re-apply logged additions and tombstones that are newer than the
+        loaded checkpoint, from byte offset `start` of the log.
+        """
+        replayed = 0
+        for position, doc, vector in self.wal.replay(start, truncate):
+            if vector is None:
+                if position < len(self.documents):
+                    self.deleted.add(position)
+                continue
+            if position < len(self.documents):
+                continue  # Already part of the checkpoint
+            if position > len(self.documents):
+                logger.warning(f"Gap in write-ahead log at position {position}, stopping replay")
+                break
+            self._writable_index().add(vector.reshape(1, -1))
+            self.documents.append(doc)
+            replayed += 1
+        self._wal_offset = self.wal.replayed_to
+        return replayed
+    
+    def _passage_rows(self):
+        return db.session.execute(
+            db.select(ContentPassage, ScrapedContent.url, ScrapedContent.content_type)
+            .join(ScrapedContent, ScrapedContent.id == ContentPassage.content_id)
+            .order_by(ContentPassage.id)
+        ).all()
+    
+    def passage_texts(self) -> List[str]:
+        """
+        Texts of every passage in the database, in index order.
+        """
+        return [f"{passage.title}\n{passage.text}" for passage, _, _ in self._passage_rows()]
+    
+    def encode(self, texts: List[str], batch_size: int = 32, pool=None) -> np.ndarray:
+        """
+        Embed texts as L2-normalized float32 vectors, optionally on a
+        multi-process encode pool.
+        """
+        if pool is not None:
+            embeddings = self.model.encode_multi_process(texts, pool, batch_size=batch_size)
+        else:
+            embeddings = self.model.encode(texts, batch_size=batch_size)
+        embeddings = np.array(embeddings).astype('float32')
         
-        # Create new index
-        self.create_index()
+        # Normalize for cosine similarity
+        faiss.normalize_L2(embeddings)
+        return embeddings
     
-    def create_index(self):
+    def encode_query(self, query: str) -> np.ndarray:
         """
-        Create vector index from scraped content in database.
+        Embed a single query as a (1, dimension) array, using the query cache.
         """
-        with app.app_context():
-            contents = ScrapedContent.query.all()
+        return self.encode_queries([query])
+    
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embed several queries as an (n, dimension) array. Queries missing
+        from the query cache are encoded together in one forward pass.
+        """
+        embeddings = [self.query_cache.get(query) for query in queries]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            encoded = self.encode([queries[i] for i in missing], batch_size=max(32, len(missing)))
+            for i, embedding in zip(missing, encoded):
+                self.query_cache.put(queries[i], embedding)
+                embeddings[i] = embedding
+        return np.vstack(embeddings)
+    
+    def _start_encode_pool(self, total: int):
+        """
+        Start a multi-process encode pool for a large rebuild, if configured.
+        """
+        if ENCODE_WORKERS <= 1 or total < ENCODE_BATCH_SIZE * ENCODE_WORKERS:
+            return None
+        if not hasattr(self.model, 'start_multi_process_pool'):
+            return None
+        logger.info(f"Starting {ENCODE_WORKERS} encoder processes")
+        return self.model.start_multi_process_pool(['cpu'] * ENCODE_WORKERS)
+    
+    def _train(self, pending: List[np.ndarray]) -> faiss.Index:
+        """
+        Build an index trained on the embeddings held back so far, and add them.
+        """
+        if not pending:
+            logger.warning("No scraped content found in database")
+            # An empty flat index; there is nothing to train on
+            return faiss.IndexFlatIP(self.dimension)
+        embeddings = np.vstack(pending)
+        if len(embeddings) > TRAIN_SAMPLE_SIZE:
+            sample = np.random.default_rng().choice(len(embeddings), TRAIN_SAMPLE_SIZE, replace=False)
+            training = embeddings[sample]
+        else:
+            training = embeddings
+        index = ann_index.build_index(self.index_type, self.dimension, training)
+        index.add(embeddings)
+        return index
+    
+    def _stream_passages(self, query, writer: DocStoreWriter, passage_ids: array, pool=None,
+                         index: faiss.Index = None, pending: List[np.ndarray] = None,
+                         progress: dict = None) -> faiss.Index:
+        """
+        Encode the passages a query yields chunk by chunk, writing their
+        metadata to `writer` and adding their vectors to `index`. Until the
+        index exists, embeddings are collected in `pending` and the index is
+        trained once TRAIN_SAMPLE_SIZE of them are available.
+        """
+        rows = db.session.execute(query.execution_options(yield_per=REBUILD_CHUNK_SIZE))
+        for chunk in rows.partitions():
+            # Combine title and passage for better search
+            texts = [f"{passage.title}\n{passage.text}" for passage, _, _ in chunk]
+            embeddings = self.encode(texts, batch_size=ENCODE_BATCH_SIZE, pool=pool)
+            for passage, url, content_type in chunk:
+                writer.add(self._passage_document(passage, url, content_type))
+                passage_ids.append(passage.id)
             
-            if not contents:
-                logger.warning("No scraped content found in database")
-                # Create empty index
-                self.index = faiss.IndexFlatIP(self.dimension)
-                self.documents = []
-                return
+            if index is None:
+                pending.append(embeddings)
+                if sum(len(e) for e in pending) >= TRAIN_SAMPLE_SIZE:
+                    index = self._train(pending)
+                    pending.clear()
+            else:
+                index.add(embeddings)
             
-            # Prepare documents
-            texts = []
-            self.documents = []
+            if progress is not None:
+                progress['done'] += len(chunk)
+                now = time.time()
+                if now - progress['reported'] >= PROGRESS_SECONDS:
+                    progress['reported'] = now
+                    rate = progress['done'] / max(now - progress['started'], 1e-9)
+                    logger.info(f"Embedded {progress['done']}/{progress['total']} passages ({rate:.0f} docs/sec)")
+        return index
+    
+    def _missing_positions(self, passage_ids: array, max_id: int) -> List[int]:
+        """
+        Positions of streamed passages that have since been deleted from the
+        database. Both sides are in id order, so this is a single merge pass.
+        """
+        current = iter(db.session.scalars(
+            db.select(ContentPassage.id)
+            .where(ContentPassage.id <= max_id)
+            .order_by(ContentPassage.id)
+            .execution_options(yield_per=REBUILD_CHUNK_SIZE)
+        ))
+        missing = []
+        current_id = next(current, None)
+        for position, passage_id in enumerate(passage_ids):
+            if passage_id > max_id:
+                break  # Caught up under the lock, so still current
+            while current_id is not None and current_id < passage_id:
+                current_id = next(current, None)
+            if current_id != passage_id:
+                missing.append(position)
+        return missing
+    
+    def create_index(self):
+        """
+        Rebuild the vector index from the content passages in the database.
+        
+        Passages are streamed from the database in chunks, encoded in tuned
+        batches (across ENCODE_WORKERS processes when configured) and added
+        to the new index as they go, while their metadata is streamed to the
+        next generation's document file. Memory stays bounded by the chunk
+        size and training sample, and searches keep using the current index
+        until the new one is swapped in; passages added or removed during the
+        rebuild are reconciled before the swap.
+        """
+        with app.app_context():
+            started = time.time()
+            total, max_id = db.session.execute(
+                db.select(func.count(ContentPassage.id), func.coalesce(func.max(ContentPassage.id), 0))
+            ).one()
+            logger.info(f"Rebuilding vector index from {total} passages")
             
-            for content in contents:
-                # Combine title and content for better search
-                text = f"{content.title}\n{content.content}"
-                texts.append(text)
+            staging_path = os.path.join(self.data_dir, 'documents.rebuild.bin')
+            writer = DocStoreWriter(staging_path)
+            passage_ids = array('q')
+            pending = []
+            progress = {'done': 0, 'total': total, 'started': started, 'reported': started}
+            pool = self._start_encode_pool(total)
+            try:
+                passages = (
+                    db.select(ContentPassage, ScrapedContent.url, ScrapedContent.content_type)
+                    .join(ScrapedContent, ScrapedContent.id == ContentPassage.content_id)
+                    .order_by(ContentPassage.id)
+                )
+                index = self._stream_passages(passages.where(ContentPassage.id <= max_id), writer, passage_ids,
+                                              pool=pool, pending=pending, progress=progress)
                 
-                self.documents.append({
-                    'id': content.id,
-                    'url': content.url,
-                    'title': content.title,
-                    'content': content.content,
-                    'content_type': content.content_type,
-                    'text': text
-                })
+                with self._lock:
+                    # Catch up with passages written while the rebuild ran
+                    index = self._stream_passages(passages.where(ContentPassage.id > max_id), writer, passage_ids,
+                                                  index=index, pending=pending)
+                    if index is None:
+                        index = self._train(pending)
+                    writer.close()
+                    
+                    generation = self.generation + 1
+                    os.replace(staging_path, self._docs_file(generation))
+                    self._publish(generation, index, self._missing_positions(passage_ids, max_id))
+            except Exception:
+                writer.abort()
+                raise
+            finally:
+                if pool is not None:
+                    self.model.stop_multi_process_pool(pool)
             
-            # Generate embeddings
-            logger.info(f"Generating embeddings for {len(texts)} documents")
-            embeddings = self.model.encode(texts, convert_to_tensor=False)
-            embeddings = np.array(embeddings).astype('float32')
-            
-            # Normalize for cosine similarity
-            faiss.normalize_L2(embeddings)
-            
-            # Create FAISS index
-            self.index = faiss.IndexFlatIP(self.dimension)
-            self.index.add(embeddings)
+            elapsed = time.time() - started
+            logger.info(f"Created {ann_index.index_type_of(index)} vector index with {len(passage_ids)} passages "
+                        f"in {elapsed:.1f}s ({len(passage_ids) / max(elapsed, 1e-9):.0f} docs/sec)")
+    
+    @staticmethod
+    def _passage_document(passage: ContentPassage, url: str, content_type: str) -> dict:
+        """
+        Build the stored metadata for one indexed passage.
+        """
+        return {
+            'id': passage.content_id,
+            'passage_id': passage.id,
+            'url': url,
+            'title': passage.title,
+            'content': passage.text,
+            'content_type': content_type,
+            'start_offset': passage.start_offset,
+            'end_offset': passage.end_offset
+        }
+    
+    def checkpoint(self):
+        """
+        Atomically persist the index and documents as a new generation,
+        then empty the write-ahead log.
+        """
+        with self._lock:
+            generation = self.generation + 1
+            writer = DocStoreWriter(self._docs_file(generation))
+            self.documents.write_to(writer)
+            writer.close()
+            self._publish(generation, self.index, self.deleted)
+    
+    def _publish(self, generation: int, index: faiss.Index, deleted):
+        """
+        Make a generation whose document file is already written current:
+        write its index, replace the manifest, empty the write-ahead log and
+        drop the previous generation. Call with the lock held.
+        
+        The manifest is replaced last, so a crash at any point leaves either
+        the old generation plus its log or the new generation in effect.
+        """
+        documents = AppendableDocStore(DocStore(self._docs_file(generation)))
+        
+        # Index: write to a temp file, then rename into place
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_dir, prefix='.index-')
+        os.close(fd)
+        try:
+            faiss.write_index(index, tmp_path)
+            with open(tmp_path, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._index_file(generation))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        
+        manifest = {
+            'generation': generation,
+            'count': len(documents),
+            'dimension': self.dimension,
+            'index_type': ann_index.index_type_of(index),
+            'deleted': sorted(deleted)
+        }
+        if INDEX_MMAP:
+            # Serve the written file so other processes share its pages
+            index = ann_index.read_index(self._index_file(generation), mmap=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_dir, prefix='.manifest-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        with self._file_lock(exclusive=True):
+            os.replace(tmp_path, self.manifest_file)
+            self._manifest_stat = self._stat_manifest()
             
-            # Save index and documents
-            faiss.write_index(self.index, self.index_file)
-            with open(self.docs_file, 'wb') as f:
-                pickle.dump(self.documents, f)
+            self.wal.reset()
+            self._wal_offset = 0
             
-            logger.info(f"Created vector index with {len(texts)} documents")
+            # Serve from the new generation and drop the old one. Processes
+            # still serving it keep their open mappings.
+            old_documents = self.documents
+            self.index = index
+            self._mapped = INDEX_MMAP
+            self.documents = documents
+            self.deleted = set(deleted)
+            old_documents.close()
+            for path in (self._index_file(self.generation), self._docs_file(self.generation)):
+                if os.path.exists(path):
+                    os.remove(path)
+        
+        self.generation = generation
+        self._last_checkpoint = time.time()
+        logger.info(f"Checkpointed vector index generation {generation} ({manifest['count']} documents)")
+    
+    def _maybe_checkpoint(self):
+        if self._compaction is not None and self._compaction.is_alive():
+            return  # The rebuild publishes a new generation and resets the WAL
+        if (len(self.deleted) >= COMPACT_MIN_DELETED
+                and len(self.deleted) >= COMPACT_RATIO * len(self.documents)):
+            # Tombstones cost search work and space; re-embed from the database
+            # without holding up the update that crossed the threshold
+            logger.info(f"Compacting vector index ({len(self.deleted)} of {len(self.documents)} passages deleted)")
+            self._compaction = threading.Thread(target=self._compact, name='vector-compaction', daemon=True)
+            self._compaction.start()
+            return
+        if (self.wal.size() >= CHECKPOINT_BYTES
+                or time.time() - self._last_checkpoint >= CHECKPOINT_SECONDS):
+            self.checkpoint()
     
-    def search(self, query: str, top_k: int = 5) -> List[Tuple[dict, float]]:
+    def _compact(self):
+        try:
+            self.create_index()
+        except Exception as e:
+            logger.error(f"Error compacting vector index: {e}")
+    
+    def search(self, query: str, top_k: int = 5, nprobe: int = None,
+               ef_search: int = None) -> List[Tuple[dict, float]]:
         """
         Search for similar documents using vector similarity.
+        `nprobe` (IVF) and `ef_search` (HNSW) override the configured
+        recall/latency trade-off for this query.
+        """
+        return self.search_batch([query], top_k, nprobe, ef_search)[0]
+    
+    def search_batch(self, queries: List[str], top_k: int = 5, nprobe: int = None,
+                     ef_search: int = None) -> List[List[Tuple[dict, float]]]:
+        """
+        Search for several queries at once: one encode call and one index
+        search for the whole batch. Returns one result list per query.
         """
-        if self.index is None or len(self.documents) == 0:
-            return []
+        self.ensure_loaded()
+        self._maybe_reload()
+        if not queries or len(self.documents) - len(self.deleted) <= 0:
+            return [[] for _ in queries]
         
-        # Generate query embedding
-        query_embedding = self.model.encode([query], convert_to_tensor=False)
-        query_embedding = np.array(query_embedding).astype('float32')
-        faiss.normalize_L2(query_embedding)
+        # Generate query embeddings
+        query_embeddings = self.encode_queries(queries)
         
         # Search
-        scores, indices = self.index.search(query_embedding, min(top_k, len(self.documents)))
-        
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx != -1:  # Valid index
-                results.append((self.documents[idx], float(score)))
+        with self._lock:
+            exclude = np.fromiter(self.deleted, dtype='int64', count=len(self.deleted)) if self.deleted else None
+            params = ann_index.search_params(self.index, nprobe or self.nprobe, ef_search or self.ef_search,
+                                             exclude=exclude)
+            k = min(top_k, len(self.documents) - len(self.deleted))
+            scores, indices = self.index.search(query_embeddings, k, params=params)
+            
+            results = []
+            for row_scores, row_indices in zip(scores, indices):
+                results.append([(self.documents[idx], float(score))
+                                for score, idx in zip(row_scores, row_indices)
+                                if idx != -1])  # Valid index
         
         return results
     
+    def add_documents(self, contents: List[ScrapedContent], batch_size: int = 64):
+        """
+        Add the passages of several documents to the index.
+        
+        Passages are encoded in batches; each batch is appended to the
+        write-ahead log (one fsync) before it is applied in memory. The full
+        index is only rewritten when a checkpoint threshold is reached.
+        """
+        self._index_passages([content.id for content in contents], batch_size)
+    
     def add_document(self, content: ScrapedContent):
         """
-        Add a new document to the index.
+        Add the passages of a new document to the index.
         """
-        if self.index is None:
-            self.load_or_create_index()
+        self.add_documents([content])
+    
+    def update_documents(self, contents: List[ScrapedContent], batch_size: int = 64):
+        """
+        Re-embed documents whose content changed.
         
-        text = f"{content.title}\n{content.content}"
-        embedding = self.model.encode([text], convert_to_tensor=False)
-        embedding = np.array(embedding).astype('float32')
-        faiss.normalize_L2(embedding)
+        The passages previously indexed for them are tombstoned in the same
+        log write as the first batch of new passages, so the rest of the
+        index is left untouched. Tombstoned vectors are excluded from search
+        and dropped when the index is compacted.
+        """
+        self._index_passages([content.id for content in contents], batch_size, replace=True)
+    
+    def update_document(self, content: ScrapedContent):
+        """
+        Re-embed a single changed document.
+        """
+        self.update_documents([content])
+    
+    def remove_documents(self, content_ids: List[int]):
+        """
+        Tombstone every passage of the given documents.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            self.wal.append(self._tombstone(content_ids))
+            self._maybe_checkpoint()
+    
+    def _tombstone(self, content_ids: List[int]) -> List[Tuple[int, dict, None]]:
+        """
+        Mark the live passages of the given documents as deleted and return
+        the tombstone records for the write-ahead log. Call with the lock held.
+        """
+        stale = [p for p in self.documents.positions_of(content_ids) if p not in self.deleted]
+        self.deleted.update(stale)
+        return [(position, {}, None) for position in stale]
+    
+    def _index_passages(self, content_ids: List[int], batch_size: int, replace: bool = False):
+        self.ensure_loaded()
+        
+        if not content_ids:
+            return
         
-        self.index.add(embedding)
+        rows = db.session.execute(
+            db.select(ContentPassage, ScrapedContent.url, ScrapedContent.content_type)
+            .join(ScrapedContent, ScrapedContent.id == ContentPassage.content_id)
+            .where(ContentPassage.content_id.in_(content_ids))
+            .order_by(ContentPassage.content_id, ContentPassage.position)
+        ).all()
         
-        self.documents.append({
-            'id': content.id,
-            'url': content.url,
-            'title': content.title,
-            'content': content.content,
-            'content_type': content.content_type,
-            'text': text
-        })
+        if replace and not rows:
+            # The documents no longer have any content to index
+            self.remove_documents(content_ids)
+            return
+        
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            texts = [f"{passage.title}\n{passage.text}" for passage, _, _ in batch]
+            embeddings = self.encode(texts, batch_size=batch_size)
+            
+            with self._lock:
+                position = len(self.documents)
+                docs = [self._passage_document(passage, url, content_type) for passage, url, content_type in batch]
+                records = [
+                    (position + i, doc, embedding)
+                    for i, (doc, embedding) in enumerate(zip(docs, embeddings))
+                ]
+                if replace and start == 0:
+                    # Old passages must be found before the new ones are appended
+                    records = self._tombstone(content_ids) + records
+                self.wal.append(records)
+                
+                self._writable_index().add(embeddings)
+                for doc in docs:
+                    self.documents.append(doc)
         
-        # Save updated index
-        faiss.write_index(self.index, self.index_file)
-        with open(self.docs_file, 'wb') as f:
-            pickle.dump(self.documents, f)
+        with self._lock:
+            self._maybe_checkpoint()
 
 
 # Global vector store instance
@@ -0,0 +1,127 @@
+"""
+Append-only write-ahead log for vector store additions.
+
+Each frame is:
+    length     uint32   payload length
+    crc32      uint32   checksum of the payload
+    payload    position uint64, metadata length uint32, JSON metadata, float32 vector
+
+`position` is the slot the document takes in the store, so replaying a log
+after a checkpoint can skip frames the checkpoint already contains. A frame
+without a vector is a tombstone: it marks the document at `position` as
+deleted. A torn
+frame at the end of the file (crash mid-write) is detected by its length or
+checksum and truncated away.
+"""
+import json
+import logging
+import os
+import struct
+import zlib
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct('<II')
+PAYLOAD_HEADER = struct.Struct('<QI')
+
+
+class WriteAheadLog:
+    def __init__(self, path: str, dimension: int):
+        self.path = path
+        self.dimension = dimension
+        self.replayed_to = 0  # Byte offset just past the last frame replay() yielded
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        return self._file
+
+    def append(self, records: List[Tuple[int, dict, Optional[np.ndarray]]]):
+        """
+        Append (position, metadata, vector) records and fsync once for the batch.
+        A record whose vector is None is a tombstone for `position`.
+        """
+        if not records:
+            return
+        frames = []
+        for position, doc, vector in records:
+            meta = json.dumps(doc, ensure_ascii=False).encode('utf-8')
+            payload = PAYLOAD_HEADER.pack(position, len(meta)) + meta
+            if vector is not None:
+                payload += np.asarray(vector, dtype='<f4').tobytes()
+            frames.append(FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+
+        f = self._open()
+        f.write(b''.join(frames))
+        f.flush()
+        os.fsync(f.fileno())
+
+    def replay(self, start: int = 0, truncate: bool = True) -> Iterator[Tuple[int, dict, Optional[np.ndarray]]]:
+        """
+        Yield every intact record in the log from byte offset `start`,
+        truncating a torn tail. Readers tailing a log another process is
+        appending to pass truncate=False: an incomplete last frame may still
+        be being written, and is picked up by the next replay.
+        """
+        self.replayed_to = start
+        if not os.path.exists(self.path):
+            return
+
+        vector_bytes = 4 * self.dimension
+        good_end = start
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            while True:
+                header = f.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    break
+                length, crc = FRAME_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+
+                position, meta_len = PAYLOAD_HEADER.unpack_from(payload, 0)
+                meta_end = PAYLOAD_HEADER.size + meta_len
+                if length not in (meta_end, meta_end + vector_bytes):
+                    break
+
+                doc = json.loads(payload[PAYLOAD_HEADER.size:meta_end])
+                if length == meta_end:
+                    vector = None  # Tombstone
+                else:
+                    vector = np.frombuffer(payload, dtype='<f4', count=self.dimension, offset=meta_end)
+                good_end = f.tell()
+                self.replayed_to = good_end
+                yield position, doc, vector
+
+            torn = truncate and f.seek(0, os.SEEK_END) > good_end
+
+        if torn:
+            logger.warning(f"Truncating torn write-ahead log tail at byte {good_end}")
+            self.close()
+            os.truncate(self.path, good_end)
+
+    def size(self) -> int:
+        """
+        Current size of the log in bytes.
+        """
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def reset(self):
+        """
+        Empty the log after a checkpoint.
+        """
+        self.close()
+        with open(self.path, 'wb') as f:
+            os.fsync(f.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None